@@ -0,0 +1,223 @@
+"""Headless benchmark suite for DiaryBot's hot paths.
+
+Each benchmark times one operation the app performs (listing entries, search,
+analytics, PDF export, saving) against a synthetic diary of a given size, and
+records wall time and peak Python heap (tracemalloc) per run. Results are
+appended to ``benchmarks/results.jsonl`` so runs can be compared over time.
+
+    python benchmarks/bench.py --sizes 1000 10000 100000
+    python benchmarks/bench.py --sizes 1000 --only search --compare
+    python benchmarks/bench.py --sizes 10000 --archived   # entries compacted into archive segments
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate import generate  # noqa: E402
+from diarybot.core import DiaryCore  # noqa: E402
+from diarybot.storage import JsonDirStore  # noqa: E402
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=3, setup=None):
+    """Register ``fn(ctx)``; ``setup(ctx)`` runs untimed before every repetition."""
+    def register(fn):
+        BENCHMARKS.append({'name': name, 'fn': fn, 'repeat': repeat, 'setup': setup})
+        return fn
+    return register
+
+
+class Context:
+    def __init__(self, data_dir, user):
+        self.data_dir = data_dir
+        self.user = user
+        self.entries_dir = os.path.join(data_dir, 'entries')
+
+    def core(self):
+        """A fresh core, so no in-memory caches carry over between repetitions."""
+        return DiaryCore(JsonDirStore(self.entries_dir), os.path.join(self.data_dir, 'users'),
+                         os.path.join(self.data_dir, 'attachments'))
+
+    def drop(self, *derived):
+        """Delete persisted derived data (e.g. '.index', '.search') to measure a cold start."""
+        for name in derived:
+            shutil.rmtree(os.path.join(self.entries_dir, name), ignore_errors=True)
+
+    def warm(self):
+        core = self.core()
+        core.count_entries(self.user)
+        core.search_index(self.user)
+        core.aggregates(self.user)
+        core.close()
+
+
+def cold(*derived):
+    return lambda ctx: ctx.drop(*derived)
+
+
+@benchmark('load_entries.cold', repeat=1, setup=cold('.index'))
+def load_entries_cold(ctx):
+    core = ctx.core()
+    core.count_entries(ctx.user)
+    core.list_entries(ctx.user, limit=200)
+    core.close()
+
+
+@benchmark('load_entries.warm', setup=lambda ctx: ctx.warm())
+def load_entries_warm(ctx):
+    core = ctx.core()
+    core.count_entries(ctx.user)
+    core.list_entries(ctx.user, limit=200)
+    core.close()
+
+
+@benchmark('search.build_index', repeat=1, setup=cold('.search'))
+def search_build(ctx):
+    core = ctx.core()
+    core.search_index(ctx.user)
+    core.close()
+
+
+@benchmark('search.query', setup=lambda ctx: ctx.warm())
+def search_query(ctx):
+    core = ctx.core()
+    for query in ('coffee', 'happy morning', 'trav*', '"long walk"', 'work emotion:negative', 'rain after:2020-01-01'):
+        core.search(ctx.user, query)
+    core.close()
+
+
+@benchmark('analytics.recompute', repeat=1, setup=cold('.aggregates'))
+def analytics_recompute(ctx):
+    core = ctx.core()
+    aggregates = core.aggregates(ctx.user)
+    aggregates.series('week')
+    core.close()
+
+
+@benchmark('analytics.warm', setup=lambda ctx: ctx.warm())
+def analytics_warm(ctx):
+    core = ctx.core()
+    aggregates = core.aggregates(ctx.user)
+    aggregates.series('week')
+    core.close()
+
+
+@benchmark('export.pdf', repeat=1, setup=lambda ctx: ctx.warm())
+def export_pdf(ctx):
+    core = ctx.core()
+    with tempfile.TemporaryDirectory() as out:
+        core.export_pdf(ctx.user, os.path.join(out, 'export.pdf'), volume_size=2000)
+    core.close()
+
+
+@benchmark('save_entry', repeat=1, setup=lambda ctx: ctx.warm())
+def save_entry(ctx):
+    # Runs last: it adds entries to the dataset.
+    core = ctx.core()
+    core.search_index(ctx.user)
+    for i in range(20):
+        entry = core.new_entry(f"Benchmark {i}", "A calm and pleasant day spent reading a good book by the window.")
+        core.add_entry(ctx.user, core.score(entry))
+    core.close()
+
+
+def measure(bench, ctx):
+    wall = []
+    for _ in range(bench['repeat']):
+        if bench['setup']:
+            bench['setup'](ctx)
+        started = time.perf_counter()
+        bench['fn'](ctx)
+        wall.append(time.perf_counter() - started)
+    # Separate traced run: tracemalloc slows code down too much to time under it.
+    if bench['setup']:
+        bench['setup'](ctx)
+    tracemalloc.start()
+    bench['fn'](ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'wall_min': min(wall), 'wall_median': statistics.median(wall), 'peak_bytes': peak}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_FILE)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_results():
+    latest = {}
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                latest[(record['name'], record['size'])] = record
+    return latest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time DiaryBot operations on synthetic diaries.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="entries in the benchmarked diary")
+    parser.add_argument('--only', action='append', help="run benchmarks whose name starts with this (repeatable)")
+    parser.add_argument('--skip', action='append', default=[], help="skip benchmarks whose name starts with this")
+    parser.add_argument('--data-dir', help="keep generated datasets here instead of a temporary directory")
+    parser.add_argument('--compare', action='store_true', help="show the change against the previous recorded run")
+    parser.add_argument('--no-record', action='store_true', help="do not append results to results.jsonl")
+    parser.add_argument('--archived', action='store_true', help="compact every entry into the archive before benchmarking")
+    args = parser.parse_args(argv)
+
+    selected = [b for b in BENCHMARKS
+                if (not args.only or any(b['name'].startswith(p) for p in args.only))
+                and not any(b['name'].startswith(p) for p in args.skip)]
+    previous = previous_results() if args.compare else {}
+    revision, run_at = git_revision(), datetime.now().isoformat(timespec='seconds')
+    base_dir = args.data_dir or tempfile.mkdtemp(prefix='diarybot-bench-')
+    try:
+        for size in args.sizes:
+            data_dir = os.path.join(base_dir, f"diary_{size}_archived" if args.archived else f"diary_{size}")
+            ctx = Context(data_dir, 'user000')
+            if not os.path.isdir(ctx.entries_dir):
+                started = time.perf_counter()
+                generate(data_dir, users=1, entries=size)
+                print(f"Generated {size} entries in {time.perf_counter() - started:.1f}s")
+                if args.archived:
+                    store = JsonDirStore(ctx.entries_dir)
+                    store.compact(ctx.user, '9999-12-31')
+                    store.close()
+            for bench in selected:
+                result = measure(bench, ctx)
+                name = f"{bench['name']}[archived]" if args.archived else bench['name']
+                record = {'name': name, 'size': size, 'revision': revision, 'run_at': run_at, **result}
+                line = (f"{name:<32} n={size:<7} {result['wall_min'] * 1000:10.1f} ms "
+                        f"(median {result['wall_median'] * 1000:.1f})  peak {result['peak_bytes'] / 2**20:8.1f} MiB")
+                before = previous.get((name, size))
+                if before:
+                    line += f"  [{(result['wall_min'] / before['wall_min'] - 1) * 100:+.0f}% vs {before['revision']}]"
+                print(line)
+                if not args.no_record:
+                    with open(RESULTS_FILE, 'a') as f:
+                        f.write(json.dumps(record) + '\n')
+            if any(b['name'] == 'save_entry' for b in selected):
+                # The dataset now has extra entries; drop it so the next run starts clean.
+                shutil.rmtree(data_dir)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
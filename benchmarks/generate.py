@@ -0,0 +1,97 @@
+"""Synthetic diary generator for the benchmark suite.
+
+Writes ``users x entries`` diary entries in the on-disk layout the app reads
+(``entries/{user}_{id}.json``, pretty-printed) with log-normally distributed
+text lengths, sentiment scores spread over [-1, 1] and a share of entries
+carrying attachments in the attachment store.
+
+    python benchmarks/generate.py DATA_DIR --users 3 --entries 10000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diarybot.attachments import AttachmentStore  # noqa: E402
+from diarybot.sentiment import classify  # noqa: E402
+
+WORDS = """
+today i we went walked talked felt feel think thought work home family friend friends morning evening night
+coffee tea breakfast lunch dinner rain sun sunny cloudy cold warm weather city park beach river mountain
+happy sad tired excited anxious calm angry grateful lonely proud bored hopeful worried relaxed stressed
+meeting project deadline email call boss team colleague office school class exam book movie music song
+run gym yoga swim bike walk dog cat kids partner mom dad brother sister trip travel train bus car flight
+long short good bad great terrible wonderful awful nice quiet busy slow fast late early again finally really
+the a an and but so because then after before while with without about over under into at on in of to for
+""".split()
+
+TITLE_WORDS = ["Monday", "Weekend", "Work", "Trip", "Rainy", "Sunny", "Family", "Late", "Morning", "Thoughts",
+               "Notes", "Day", "Evening", "Plans", "Dinner", "Walk", "News", "Reflections"]
+
+
+def make_text(rng, mean_words):
+    # Log-normal lengths: mostly short notes with a long tail of long entries.
+    count = max(3, int(rng.lognormvariate(math.log(mean_words), 0.7)))
+    sentences, words = [], [rng.choice(WORDS) for _ in range(count)]
+    for start in range(0, count, 12):
+        sentence = ' '.join(words[start:start + 12])
+        sentences.append(sentence[0].upper() + sentence[1:] + '.')
+    return ' '.join(sentences)
+
+
+def generate(data_dir, users=1, entries=1000, seed=0, mean_words=120, attachment_rate=0.05, years=10):
+    """Create the dataset under ``data_dir``; returns the list of user names."""
+    rng = random.Random(seed)
+    entries_dir = os.path.join(data_dir, 'entries')
+    os.makedirs(entries_dir, exist_ok=True)
+    attachments = AttachmentStore(os.path.join(data_dir, 'attachments'))
+    start = datetime(2026 - years, 1, 1)
+    step = timedelta(days=365 * years) / max(entries, 1)
+    names = [f"user{u:03d}" for u in range(users)]
+    with tempfile.TemporaryDirectory() as scratch:
+        for user in names:
+            for i in range(entries):
+                when = start + step * i + timedelta(seconds=rng.randrange(max(1, int(step.total_seconds()) - 1)))
+                polarity = max(-1.0, min(1.0, rng.gauss(0.1, 0.35)))
+                entry = {
+                    'id': when.strftime('%Y%m%d_%H%M%S'),
+                    'title': f"{rng.choice(TITLE_WORDS)} {rng.choice(WORDS)}",
+                    'content': make_text(rng, mean_words),
+                    'date': when.isoformat(),
+                    'emotion': classify(polarity),
+                    'sentiment_score': polarity,
+                    'attachments': []
+                }
+                if rng.random() < attachment_rate:
+                    source = os.path.join(scratch, f"photo_{i}.jpg")
+                    with open(source, 'wb') as f:
+                        f.write(rng.randbytes(rng.randrange(2048, 65536)))
+                    entry['attachments'].append(attachments.put(source))
+                    os.remove(source)
+                with open(os.path.join(entries_dir, f"{user}_{entry['id']}.json"), 'w') as f:
+                    json.dump(entry, f, indent=2)
+    attachments.close()
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic DiaryBot data directory.")
+    parser.add_argument('data_dir')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--entries', type=int, default=1000, help="entries per user")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mean-words', type=int, default=120)
+    parser.add_argument('--attachment-rate', type=float, default=0.05)
+    args = parser.parse_args(argv)
+    names = generate(args.data_dir, args.users, args.entries, args.seed, args.mean_words, args.attachment_rate)
+    print(f"Wrote {len(names) * args.entries} entries for {len(names)} user(s) to {args.data_dir}")
+
+
+if __name__ == '__main__':
+    main()
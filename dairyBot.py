@@ -1,19 +1,27 @@
+import time
+STARTED = time.perf_counter()  # Reference point for --startup-timing
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import json
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import os
-import bcrypt
-from datetime import datetime
-import speech_recognition as sr
-from textblob import TextBlob
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import shutil
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import sys
+from datetime import datetime, timedelta
+from diarybot import lazy
+from diarybot.charts import AnalyticsCharts
+from diarybot.core import DiaryCore
+from diarybot.metrics import metrics, timed, top_functions
+from diarybot.sentiment import analyze, warm_up
+from diarybot.tasks import TaskRunner
+from diarybot.users import AuthError
+from diarybot.voice import AUDIO_EXTENSIONS, Dictation, VoiceError, open_engine
+IMPORTED = time.perf_counter()
 
 class DiaryBot:
-    def __init__(self):
+    ENTRIES_PAGE_SIZE = 200  # Rows fetched into the entry list per scroll step
+    EXPORT_VOLUME_SIZE = 2000  # Larger PDF exports are split into volumes rendered in parallel
+    EMOTION_EMOJI = {'positive': '😊', 'negative': '😢', 'neutral': '😐'}
+
+    def __init__(self, startup_timing=False):
+        self.startup_timing = startup_timing
         self.root = tk.Tk()
         self.root.title("DiaryBot - Personal Diary")
         self.root.geometry("900x700")
@@ -26,60 +34,87 @@ class DiaryBot:
             'text': '#333333',
             'light_gray': '#e0e0e0'
         }
-        self.create_folders()
-        self.current_user = None
+        self.core = DiaryCore()
+        self.charts = AnalyticsCharts(os.path.join(self.core.store.data_dir, '.cache', 'charts'))
+        self.tasks = TaskRunner(self.root, cpu_initializer=warm_up)
+        self.tasks.on_change = self.update_busy_indicator
         self.attached_files = []
-        self.show_login()
-    
-    def create_folders(self):
-        for folder in ['users', 'entries', 'attachments']:
-            os.makedirs(folder, exist_ok=True)
+        self.voice_engine = None
+        self.dictation = self.dictation_task = None
+        self.current_user = self.core.resume_session()
+        if self.current_user:
+            self.show_main_app()
+        else:
+            self.show_login()
+        self.root.after_idle(self.prewarm_modules)
+
+    def prewarm_modules(self):
+        """Load charting and voice libraries in the background while the user logs in."""
+        if self.startup_timing:
+            now = time.perf_counter()
+            print(f"Imports: {(IMPORTED - STARTED) * 1000:.0f} ms, first window shown: {(now - STARTED) * 1000:.0f} ms", file=sys.stderr)
+        # The sentiment workers start from a fork server, not this threaded process; each imports TextBlob itself.
+        self.tasks.start_cpu_pool()
+        lazy.prewarm(self.charts.prepare, lazy.lazy_import('speech_recognition'), on_done=self.print_startup_report if self.startup_timing else None)
+
+    def print_startup_report(self):
+        print(f"Prewarm finished: {(time.perf_counter() - STARTED) * 1000:.0f} ms\nDeferred imports:", file=sys.stderr)
+        for line in lazy.report():
+            print(line, file=sys.stderr)
     
+    @timed('ui.clear_window')
     def clear_window(self):
         for widget in self.root.winfo_children():
             widget.destroy()
 
-    def hash_password(self, password):
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    
-    def check_password(self, password, hashed):
-        return bcrypt.checkpw(password.encode('utf-8'), hashed)
-    
     def register(self):
         username, password = self.username_entry.get().strip(), self.password_entry.get().strip()
-        if not username or not password:
-            return messagebox.showerror("Error", "Please fill in all fields.")
-        user_file = f"users/{username}.json"
-        if os.path.exists(user_file):
-            return messagebox.showerror("Error", "Username already exists.")
-        user_data = {
-            'username': username,
-            'password': self.hash_password(password).decode('utf-8'),
-            'created_date': datetime.now().isoformat()
-        }
-        with open(user_file, 'w') as f:
-            json.dump(user_data, f)
+        # bcrypt is deliberately slow; hash on an I/O thread so the window keeps painting.
+        self.set_auth_busy(True)
+        self.tasks.submit(self._register, username, password, label="Creating account",
+                          on_done=self._registered, on_error=self._auth_failed)
+
+    def _register(self, task, username, password):
+        self.core.register(username, password)
+
+    def _registered(self, _):
+        self.set_auth_busy(False)
         messagebox.showinfo("Success", "Account created successfully!")
-    
+
     def login(self):
+        if str(self.login_button['state']) == 'disabled':
+            return
         username, password = self.username_entry.get().strip(), self.password_entry.get().strip()
-        if not username or not password:
-            return messagebox.showerror("Error", "Please fill in all fields.")
-        user_file = f"users/{username}.json"
-        if not os.path.exists(user_file):
-            return messagebox.showerror("Error", "User not found.")
-        with open(user_file, 'r') as f:
-            user_data = json.load(f)
-        if self.check_password(password, user_data['password'].encode('utf-8')):
-            self.current_user = username
-            self.show_main_app()
-        else:
-            messagebox.showerror("Error", "Wrong password.")
-    
+        self.set_auth_busy(True)
+        self.tasks.submit(self._authenticate, username, password, self.remember_var.get(), label="Signing in",
+                          on_done=self._logged_in, on_error=self._auth_failed)
+
+    def _authenticate(self, task, username, password, remember):
+        self.core.login(username, password, remember)
+        return username
+
+    def _logged_in(self, username):
+        self.current_user = username
+        self.show_main_app()
+
+    def _auth_failed(self, e):
+        self.set_auth_busy(False)
+        messagebox.showerror("Error", str(e) if isinstance(e, AuthError) else f"Sign-in failed: {e}")
+
+    def set_auth_busy(self, busy):
+        if self.login_button.winfo_exists():
+            for button in (self.login_button, self.register_button):
+                button.config(state='disabled' if busy else 'normal')
+
     def logout(self):
+        self.tasks.detach_all()  # Results for this session's screens are dropped; saves still finish
+        self._reset_voice_button()
+        self.core.end_session()
+        self.core.forget(self.current_user)
         self.current_user = None
         self.show_login()
 
+    @timed('ui.show_login')
     def show_login(self):
         self.clear_window()
         main_frame = tk.Frame(self.root, bg=self.colors['primary'])
@@ -94,13 +129,18 @@ class DiaryBot:
         self.username_entry.pack(pady=(0, 20), ipady=8)
         tk.Label(login_card, text="Password:", font=('Arial', 14), bg=self.colors['white']).pack(anchor='w', pady=(0, 5))
         self.password_entry = tk.Entry(login_card, font=('Arial', 12), show='*', relief='solid', bd=1, width=30)
-        self.password_entry.pack(pady=(0, 30), ipady=8)
+        self.password_entry.pack(pady=(0, 10), ipady=8)
+        self.remember_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(login_card, text="Keep me signed in", variable=self.remember_var, font=('Arial', 10), bg=self.colors['white']).pack(anchor='w', pady=(0, 20))
         btn_frame = tk.Frame(login_card, bg=self.colors['white'])
         btn_frame.pack()
-        tk.Button(btn_frame, text="Login", command=self.login,bg=self.colors['secondary'], fg='white', font=('Arial', 12, 'bold'), relief='flat',padx=20, pady=8, cursor='hand2').pack(side='left', padx=(0, 10))
-        tk.Button(btn_frame, text="Register", command=self.register,bg=self.colors['primary'], fg='white', font=('Arial', 12, 'bold'), relief='flat',padx=20, pady=8, cursor='hand2').pack(side='left')
+        self.login_button = tk.Button(btn_frame, text="Login", command=self.login,bg=self.colors['secondary'], fg='white', font=('Arial', 12, 'bold'), relief='flat',padx=20, pady=8, cursor='hand2')
+        self.login_button.pack(side='left', padx=(0, 10))
+        self.register_button = tk.Button(btn_frame, text="Register", command=self.register,bg=self.colors['primary'], fg='white', font=('Arial', 12, 'bold'), relief='flat',padx=20, pady=8, cursor='hand2')
+        self.register_button.pack(side='left')
         self.root.bind('<Return>', lambda e: self.login())
     
+    @timed('ui.show_main_app')
     def show_main_app(self):
         self.clear_window()
         header = tk.Frame(self.root, bg=self.colors['primary'], height=60)
@@ -110,6 +150,13 @@ class DiaryBot:
         header_content.pack(fill='both', expand=True, padx=20, pady=10)
         tk.Label(header_content, text=f"Welcome, {self.current_user}!", font=('Arial', 16, 'bold'), fg='white', bg=self.colors['primary']).pack(side='left')
         tk.Button(header_content, text="Logout", command=self.logout,bg='#d9534f', fg='white', font=('Arial', 10),relief='flat', padx=15, pady=5, cursor='hand2').pack(side='right')
+        busy_frame = tk.Frame(header_content, bg=self.colors['primary'])
+        busy_frame.pack(side='right', padx=(0, 15))
+        self.busy_label = tk.Label(busy_frame, text="", font=('Arial', 10), fg='white', bg=self.colors['primary'])
+        self.busy_label.pack(side='left')
+        self.busy_bar = ttk.Progressbar(busy_frame, length=120, mode='indeterminate')
+        self.busy_cancel = tk.Button(busy_frame, text="✖", command=self.tasks.cancel_all,bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', cursor='hand2')
+        self.busy_spinning = False
         style = ttk.Style()
         style.configure('Custom.TNotebook', background=self.colors['background'])
         style.configure('Custom.TNotebook.Tab', padding=[20, 10])
@@ -120,6 +167,38 @@ class DiaryBot:
         self.create_search_tab()
         self.create_analytics_tab()
         self.create_settings_tab()
+
+    def update_busy_indicator(self, runner):
+        if not getattr(self, 'busy_bar', None) or not self.busy_bar.winfo_exists():
+            return
+        if not runner.active:
+            self.busy_bar.stop()
+            self.busy_spinning = False
+            self.busy_bar.pack_forget()
+            self.busy_cancel.pack_forget()
+            self.busy_label.config(text="")
+            return
+        task = runner.active[-1]
+        done, total, message = task.progress
+        label = message or task.label
+        if len(runner.active) > 1:
+            label += f" (+{len(runner.active) - 1} more)"
+        self.busy_label.config(text=label)
+        if not self.busy_bar.winfo_ismapped():
+            self.busy_bar.pack(side='left', padx=(10, 5))
+        if runner.can_cancel():
+            if not self.busy_cancel.winfo_ismapped():
+                self.busy_cancel.pack(side='left')
+        else:
+            self.busy_cancel.pack_forget()
+        if total:
+            self.busy_bar.stop()
+            self.busy_spinning = False
+            self.busy_bar.config(mode='determinate', maximum=total, value=done)
+        elif not self.busy_spinning:
+            self.busy_bar.config(mode='indeterminate')
+            self.busy_bar.start(10)
+            self.busy_spinning = True
     
     def create_add_entry_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -137,9 +216,11 @@ class DiaryBot:
         btn_frame.pack(fill='x', pady=(10, 0))
         left_frame = tk.Frame(btn_frame, bg=self.colors['white'])
         left_frame.pack(side='left')
-        tk.Button(left_frame, text="🎤 Voice Input", command=self.voice_input,bg='#ff9500', fg='white', font=('Arial', 10),relief='flat', padx=15, pady=8, cursor='hand2').pack(side='left', padx=(0, 10))
+        self.voice_button = tk.Button(left_frame, text="🎤 Voice Input", command=self.voice_input,bg='#ff9500', fg='white', font=('Arial', 10),relief='flat', padx=15, pady=8, cursor='hand2')
+        self.voice_button.pack(side='left', padx=(0, 10))
         tk.Button(left_frame, text="📎 Attach File", command=self.attach_file,bg='#9013fe', fg='white', font=('Arial', 10),relief='flat', padx=15, pady=8, cursor='hand2').pack(side='left')
-        tk.Button(btn_frame, text="💾 Save Entry", command=self.save_entry,bg=self.colors['secondary'], fg='white', font=('Arial', 12, 'bold'),relief='flat', padx=20, pady=10, cursor='hand2').pack(side='right')
+        self.save_button = tk.Button(btn_frame, text="💾 Save Entry", command=self.save_entry,bg=self.colors['secondary'], fg='white', font=('Arial', 12, 'bold'),relief='flat', padx=20, pady=10, cursor='hand2')
+        self.save_button.pack(side='right')
     
     def create_view_entries_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -149,15 +230,19 @@ class DiaryBot:
         header_frame = tk.Frame(container, bg=self.colors['white'])
         header_frame.pack(fill='x', pady=(0, 20))
         tk.Label(header_frame, text="Your Diary Entries", font=('Arial', 18, 'bold'), bg=self.colors['white']).pack(side='left')
+        self.entries_count_label = tk.Label(header_frame, text="", font=('Arial', 10), fg='gray', bg=self.colors['white'])
+        self.entries_count_label.pack(side='left', padx=(15, 0))
         tk.Button(header_frame, text="🔄 Refresh", command=self.load_entries,bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', padx=15, pady=5, cursor='hand2').pack(side='right')
         list_frame = tk.Frame(container, bg=self.colors['white'])
         list_frame.pack(fill='both', expand=True)
         scrollbar = tk.Scrollbar(list_frame)
         scrollbar.pack(side='right', fill='y')
-        self.entries_listbox = tk.Listbox(list_frame, yscrollcommand=scrollbar.set,font=('Arial', 11), relief='solid', bd=1)
+        self.entries_listbox = tk.Listbox(list_frame, yscrollcommand=lambda first, last: self.on_entries_scroll(scrollbar, first, last),font=('Arial', 11), relief='solid', bd=1)
         self.entries_listbox.pack(fill='both', expand=True)
         scrollbar.config(command=self.entries_listbox.yview)
         tk.Button(container, text="👁️ View Selected Entry", command=self.view_entry,bg=self.colors['secondary'], fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=15)
+        # The listbox can scroll before the first count comes back.
+        self.entries_data, self.entries_total, self.entries_page_pending, self.entries_generation = [], 0, False, 0
         self.load_entries()
     
     def create_search_tab(self):
@@ -171,6 +256,8 @@ class DiaryBot:
         self.search_entry = tk.Entry(search_frame, font=('Arial', 12), relief='solid', bd=1)
         self.search_entry.pack(side='left', fill='x', expand=True, ipady=8)
         tk.Button(search_frame, text="🔍 Search", command=self.search_entries,bg=self.colors['primary'], fg='white', font=('Arial', 12),relief='flat', padx=20, pady=8, cursor='hand2').pack(side='right', padx=(10, 0))
+        tk.Label(container, text='Tip: use word*, "exact phrase", emotion:positive, after:2024-01-01, before:2024-12-31',
+                 font=('Arial', 9), fg='gray', bg=self.colors['white']).pack(anchor='w', pady=(0, 10))
         self.search_results = tk.Listbox(container, font=('Arial', 11), relief='solid', bd=1)
         self.search_results.pack(fill='both', expand=True)
     
@@ -180,9 +267,15 @@ class DiaryBot:
         container = tk.Frame(frame, bg=self.colors['white'], padx=30, pady=30)
         container.pack(fill='both', expand=True, padx=20, pady=20)
         tk.Label(container, text="Your Diary Analytics", font=('Arial', 18, 'bold'), bg=self.colors['white']).pack(pady=(0, 20))
-        tk.Button(container, text="📊 Generate Analytics", command=self.generate_analytics,bg='#9013fe', fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=(0, 20))
+        controls = tk.Frame(container, bg=self.colors['white'])
+        controls.pack(pady=(0, 20))
+        tk.Button(controls, text="📊 Generate Analytics", command=self.generate_analytics,bg='#9013fe', fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(side='left')
+        tk.Label(controls, text="Mood over time by:", font=('Arial', 11), bg=self.colors['white']).pack(side='left', padx=(20, 5))
+        self.analytics_period = tk.StringVar(value='week')
+        ttk.Combobox(controls, textvariable=self.analytics_period, values=('day', 'week', 'month'), state='readonly', width=8).pack(side='left')
         self.analytics_plot_frame = tk.Frame(container, bg=self.colors['white'])
         self.analytics_plot_frame.pack(fill='both', expand=True)
+        self.analytics_key = None  # Key of the chart images on screen
 
     def create_settings_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -190,39 +283,153 @@ class DiaryBot:
         container = tk.Frame(frame, bg=self.colors['white'], padx=30, pady=30)
         container.pack(fill='both', expand=True, padx=20, pady=20)
         tk.Label(container, text="Settings & Export", font=('Arial', 18, 'bold'), bg=self.colors['white']).pack(pady=(0, 30))
+        filter_frame = tk.Frame(container, bg=self.colors['white'])
+        filter_frame.pack(pady=(0, 10))
+        tk.Label(filter_frame, text="From (YYYY-MM-DD):", font=('Arial', 10), bg=self.colors['white']).pack(side='left')
+        self.export_start = tk.Entry(filter_frame, font=('Arial', 10), relief='solid', bd=1, width=12)
+        self.export_start.pack(side='left', padx=(5, 15))
+        tk.Label(filter_frame, text="To:", font=('Arial', 10), bg=self.colors['white']).pack(side='left')
+        self.export_end = tk.Entry(filter_frame, font=('Arial', 10), relief='solid', bd=1, width=12)
+        self.export_end.pack(side='left', padx=(5, 15))
+        tk.Label(filter_frame, text="Emotion:", font=('Arial', 10), bg=self.colors['white']).pack(side='left')
+        self.export_emotion = tk.StringVar(value='all')
+        ttk.Combobox(filter_frame, textvariable=self.export_emotion, values=('all', 'positive', 'negative', 'neutral'), state='readonly', width=9).pack(side='left', padx=(5, 0))
         tk.Button(container, text="📄 Export to PDF", command=self.export_to_pdf,bg='#d9534f', fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=5)
-        stats_text = tk.Text(container, height=8, font=('Arial', 11), relief='solid', bd=1, state='disabled')
-        stats_text.pack(fill='x', pady=(20, 0))
-        user_entries = [f for f in os.listdir('entries') if f.startswith(f"{self.current_user}_")]
+        tk.Button(container, text="🔁 Re-analyze Sentiment", command=self.rescore_entries,bg='#9013fe', fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=5)
+        tk.Button(container, text="🧹 Clean Up Attachments", command=self.clean_attachments,bg=self.colors['primary'], fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=5)
+        tk.Button(container, text="🗄 Archive Old Entries", command=self.archive_entries,bg=self.colors['text'], fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=5)
+        tk.Button(container, text="🎙 Transcribe Recordings", command=self.transcribe_recordings,bg='#ff9500', fg='white', font=('Arial', 12),relief='flat', padx=20, pady=10, cursor='hand2').pack(pady=5)
+        self.stats_text = tk.Text(container, height=8, font=('Arial', 11), relief='solid', bd=1, state='disabled')
+        self.stats_text.pack(fill='x', pady=(20, 0))
+        perf_frame = tk.Frame(container, bg=self.colors['white'])
+        perf_frame.pack(fill='x', pady=(20, 5))
+        tk.Label(perf_frame, text="Performance", font=('Arial', 12, 'bold'), bg=self.colors['white']).pack(side='left')
+        tk.Button(perf_frame, text="💾 Export Metrics", command=self.export_metrics,bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', padx=10, pady=3, cursor='hand2').pack(side='right')
+        self.profile_button = tk.Button(perf_frame, text="⏺ Start Profiling", command=self.toggle_profiling,bg='#9013fe', fg='white', font=('Arial', 10),relief='flat', padx=10, pady=3, cursor='hand2')
+        self.profile_button.pack(side='right', padx=5)
+        tk.Button(perf_frame, text="🔄 Refresh", command=self.show_metrics,bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', padx=10, pady=3, cursor='hand2').pack(side='right')
+        self.metrics_text = tk.Text(container, height=10, font=('Courier', 9), relief='solid', bd=1, wrap='none', state='disabled')
+        self.metrics_text.pack(fill='both', expand=True)
+        if metrics.profiler.running:
+            self.profile_button.config(text="⏹ Stop Profiling")
+        self.show_metrics()
+        self.tasks.submit(self._count_entries, self.current_user, label="Counting entries", on_done=self.show_user_stats)
+
+    @timed('ui.show_user_stats')
+    def show_user_stats(self, entry_count):
         stats = f"""USER STATISTICS:
-• Total entries: {len(user_entries)}
+• Total entries: {entry_count}
 • Account: {self.current_user}
 • Data location: Local files
 """
-        stats_text.config(state='normal')
-        stats_text.insert(1.0, stats)
-        stats_text.config(state='disabled')
+        self.stats_text.config(state='normal')
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(1.0, stats)
+        self.stats_text.config(state='disabled')
     
+    def set_metrics_text(self, text):
+        self.metrics_text.config(state='normal')
+        self.metrics_text.delete(1.0, tk.END)
+        self.metrics_text.insert(1.0, text)
+        self.metrics_text.config(state='disabled')
+
+    def show_metrics(self):
+        snapshot = metrics.snapshot()
+        lines = [f"{'operation':<28}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, row in snapshot['operations'].items():
+            lines.append(f"{name:<28}{row['count']:>7}" + ''.join(f"{row[k] * 1000:>10.1f}" for k in ('p50', 'p90', 'p99', 'max')))
+        if snapshot['counters']:
+            lines.append('')
+            lines += [f"{name:<28}{value:>7}" for name, value in snapshot['counters'].items()]
+        self.set_metrics_text('\n'.join(lines))
+
+    def toggle_profiling(self):
+        if not metrics.profiler.running:
+            metrics.profiler.start()
+            self.profile_button.config(text="⏹ Stop Profiling")
+            return
+        stats = metrics.profiler.stop()
+        self.profile_button.config(text="⏺ Start Profiling")
+        if stats is None:
+            return messagebox.showinfo("Profiling", "Nothing instrumented ran while profiling.")
+        filename = f"DiaryProfile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+        stats.dump_stats(filename)
+        self.set_metrics_text(f"Profile saved as {filename} (open with snakeviz or pstats)\n\n{top_functions(stats, limit=25)}")
+
+    def export_metrics(self):
+        base = f"DiaryMetrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        try:
+            metrics.dump(f"{base}.json")
+            metrics.dump(f"{base}.prom")
+        except OSError as e:
+            return messagebox.showerror("Error", f"Failed to export metrics: {e}")
+        messagebox.showinfo("Success", f"Metrics exported as {base}.json and {base}.prom")
+
+    def get_voice_engine(self):
+        if self.voice_engine is None:
+            self.voice_engine = open_engine()  # $DIARYBOT_VOICE_ENGINE, e.g. vosk:<model dir> for offline use
+        return self.voice_engine
+
     def voice_input(self):
-        r = sr.Recognizer()
+        """Start dictation, or stop it if it is running; text is appended as it is recognised."""
+        if self.dictation_task is not None and not self.dictation_task.cancelled:
+            self.dictation.stop()
+            self.voice_button.config(text="⏳ Finishing...", state='disabled')
+            return
         try:
-            with sr.Microphone() as source:
-                messagebox.showinfo("Voice Input", "Speak now... (Click OK and start speaking)")
-                self.root.update_idletasks()  # Ensure messagebox appears before listening
-                r.adjust_for_ambient_noise(source)
-                audio = r.listen(source, timeout=10)
-            text = r.recognize_google(audio)
-            self.content_text.insert(tk.END, f"\n{text}")
-            messagebox.showinfo("Success", "Voice input captured!")
-        except sr.WaitTimeoutError:
-            messagebox.showwarning("Timeout", "No speech detected.")
-        except sr.UnknownValueError:
-            messagebox.showerror("Error", "Could not understand audio.")
-        except sr.RequestError as e:
-            messagebox.showerror("Error", f"Could not request results; check your internet connection: {e}")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
-    
+            engine = self.get_voice_engine()
+        except (VoiceError, ValueError) as e:
+            return messagebox.showerror("Error", str(e))
+        self.dictation = Dictation(engine, on_text=None)
+        self.voice_button.config(text="⏹ Stop Dictation")
+        self.dictation_task = self.tasks.submit(self._dictate, self.dictation, label="Listening", cancellable=True,
+                                                on_emit=self._dictated_text, on_done=self._dictation_done, on_error=self._dictation_failed,
+                                                on_cancel=self._reset_voice_button)
+
+    def _dictate(self, task, dictation):
+        dictation.on_text = task.emit
+        return dictation.run(task)
+
+    def _dictated_text(self, text):
+        last = self.content_text.get('end-2c', 'end-1c')
+        self.content_text.insert(tk.END, text if not last or last.isspace() else f" {text}")
+        self.content_text.see(tk.END)
+
+    def _dictation_done(self, text):
+        self._reset_voice_button()
+        if not text:
+            messagebox.showwarning("Voice Input", "No speech detected.")
+
+    def _dictation_failed(self, e):
+        self._reset_voice_button()
+        messagebox.showerror("Error", str(e) if isinstance(e, VoiceError) else f"Voice input failed: {e}")
+
+    def _reset_voice_button(self):
+        self.dictation = self.dictation_task = None
+        if getattr(self, 'voice_button', None) and self.voice_button.winfo_exists():
+            self.voice_button.config(text="🎤 Voice Input", state='normal')
+
+    def transcribe_recordings(self):
+        paths = filedialog.askopenfilenames(title="Select recordings to transcribe",
+                                            filetypes=[("Audio files", ' '.join(f"*{ext}" for ext in AUDIO_EXTENSIONS)), ("All files", "*.*")])
+        if not paths:
+            return
+        try:
+            engine = self.get_voice_engine()
+        except (VoiceError, ValueError) as e:
+            return messagebox.showerror("Error", str(e))
+        self.tasks.submit(self._import_audio, self.current_user, list(paths), engine, label="Transcribing recordings",
+                          cancellable=True, on_cancel=self.load_entries,
+                          on_done=lambda imported: self._audio_imported(imported, len(paths)),
+                          on_error=lambda e: messagebox.showerror("Error", f"Transcription failed: {e}"))
+
+    def _import_audio(self, task, user, paths, engine):
+        return self.core.import_audio(user, paths, engine, workers=self.tasks.cpu_workers, task=task)
+
+    def _audio_imported(self, imported, total):
+        messagebox.showinfo("Success", f"Created {imported} entries from {total} recording(s).")
+        self.load_entries()
+
     def attach_file(self):
         file_path = filedialog.askopenfilename(
             title="Select file to attach",
@@ -230,64 +437,158 @@ class DiaryBot:
         )
         if file_path:
             filename = os.path.basename(file_path)
-            new_path = f"attachments/{self.current_user}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-            try:
-                shutil.copy2(file_path, new_path)
-                self.attached_files.append(new_path)
-                messagebox.showinfo("Success", f"File attached: {filename}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to attach file: {e}")
+            self.tasks.submit(self._copy_attachment, file_path, label=f"Attaching {filename}",
+                              on_done=lambda blob_path: self._attachment_added(blob_path, filename),
+                              on_error=lambda e: messagebox.showerror("Error", f"Failed to attach file: {e}"))
+
+    def _copy_attachment(self, task, file_path):
+        blob_path = self.core.attachments.put(file_path, task=task)
+        self.core.attachments.thumbnail(blob_path)  # Warm the preview cache for view_entry
+        return blob_path
+
+    def _attachment_added(self, blob_path, filename):
+        self.attached_files.append(blob_path)
+        messagebox.showinfo("Success", f"File attached: {filename}")
     
     def save_entry(self):
         title, content = self.title_entry.get().strip(), self.content_text.get(1.0, tk.END).strip()
         if not title or not content:
             return messagebox.showerror("Error", "Please fill in title and content.")
-        blob = TextBlob(content)
-        polarity = blob.sentiment.polarity
-        emotion = "positive" if polarity > 0.1 else "negative" if polarity < -0.1 else "neutral"
-        entry = {
-            'id': datetime.now().strftime('%Y%m%d_%H%M%S'),
-            'title': title,
-            'content': content,
-            'date': datetime.now().isoformat(),
-            'emotion': emotion,
-            'sentiment_score': polarity,
-            'attachments': self.attached_files.copy()  # Keep paths of attached files
-        }
+        entry = self.core.new_entry(title, content, self.attached_files)
+        user, button = self.current_user, self.save_button
+        button.config(state='disabled')
+        # TextBlob runs in a worker process, the write on an I/O thread; the window stays responsive.
+        # The entry belongs to whoever clicked Save, even if they log out before it is written.
+        self.tasks.submit(analyze, content, kind='cpu', label="Analyzing sentiment", persistent=True,
+                          on_done=lambda result: self._store_entry(user, button, entry, *result),
+                          on_error=lambda e: self._save_failed(button, e))
+
+    def _store_entry(self, user, button, entry, polarity, emotion):
+        entry.update(emotion=emotion, sentiment_score=polarity)
+        self.tasks.submit(self._write_entry, user, entry, label="Saving entry", persistent=True,
+                          on_done=lambda _: self._entry_saved(button, entry), on_error=lambda e: self._save_failed(button, e))
+
+    def _write_entry(self, task, user, entry):
+        self.core.add_entry(user, entry)
+
+    def _entry_saved(self, button, entry):
+        if not button.winfo_exists():
+            return  # Logged out meanwhile; the form it came from is gone
+        button.config(state='normal')
+        messagebox.showinfo("Success", f"Entry saved! Emotion detected: {entry['emotion']}")
+        self.title_entry.delete(0, tk.END)
+        self.content_text.delete(1.0, tk.END)
+        self.attached_files = []
+        self.load_entries()  # Refresh entries list after saving
+
+    def _save_failed(self, button, error):
+        if button.winfo_exists():
+            button.config(state='normal')
+        messagebox.showerror("Error", f"Failed to save entry: {error}")
+
+    def rescore_entries(self):
+        self.tasks.submit(self._rescore, self.current_user, label="Re-analyzing sentiment", cancellable=True, on_cancel=self.load_entries,
+                          on_done=self._rescore_done, on_error=lambda e: messagebox.showerror("Error", f"Re-analysis failed: {e}"))
+
+    def _rescore(self, task, user):
+        return self.core.rescore(user, task=task, workers=self.tasks.cpu_workers)
+
+    def _rescore_done(self, stats):
+        messagebox.showinfo("Success", f"Re-analyzed {stats['scanned']} entries "
+                            f"({stats['cached']} from cache), {stats['updated']} updated.")
+        self.load_entries()
+
+    def clean_attachments(self):
+        self.tasks.submit(self._collect_attachments, label="Cleaning up attachments",
+                          on_done=lambda removed: messagebox.showinfo("Success", f"Removed {len(removed)} unused attachment(s)."),
+                          on_error=lambda e: messagebox.showerror("Error", f"Attachment clean-up failed: {e}"))
+
+    def _collect_attachments(self, task):
+        return self.core.collect_attachments()
+
+    def archive_entries(self):
+        default = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        before = simpledialog.askstring("Archive Old Entries", "Compact entries dated before (YYYY-MM-DD):", initialvalue=default, parent=self.root)
+        if not before:
+            return
         try:
-            with open(f"entries/{self.current_user}_{entry['id']}.json", 'w') as f:
-                json.dump(entry, f, indent=2)
-            messagebox.showinfo("Success", f"Entry saved! Emotion detected: {emotion}")
-            self.title_entry.delete(0, tk.END)
-            self.content_text.delete(1.0, tk.END)
-            self.attached_files = []
-            self.load_entries()  # Refresh entries list after saving
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save entry: {e}")
-    
+            datetime.strptime(before, '%Y-%m-%d')
+        except ValueError:
+            return messagebox.showerror("Error", f"Invalid date: {before} (use YYYY-MM-DD).")
+        self.tasks.submit(self._archive, self.current_user, before, label="Archiving entries",
+                          on_done=lambda moved: messagebox.showinfo("Success", f"Archived {moved} entries dated before {before}."),
+                          on_error=lambda e: messagebox.showerror("Error", f"Archiving failed: {e}"))
+
+    def _archive(self, task, user, before):
+        return self.core.archive_entries(user, before)
+
+    def _count_entries(self, task, user):
+        return self.core.count_entries(user)
+
     def load_entries(self):
+        # Pages still in flight from an earlier load are dropped when they arrive.
+        self.entries_generation += 1
+        self.entries_total = 0
+        self.entries_count_label.config(text="Loading...")
+        generation = self.entries_generation
+        self.tasks.submit(self._count_entries, self.current_user, label="Loading entries",
+                          on_done=lambda entry_count: self._entries_counted(generation, entry_count))
+
+    def _entries_counted(self, generation, entry_count):
+        if generation != self.entries_generation:
+            return
         self.entries_listbox.delete(0, tk.END)
-        entries = []
-        for filename in os.listdir('entries'):
-            if filename.startswith(f"{self.current_user}_") and filename.endswith('.json'):
-                try:
-                    with open(f"entries/{filename}", 'r') as f:
-                        entries.append(json.load(f))
-                except json.JSONDecodeError:
-                    print(f"Skipping malformed JSON file: {filename}")
-        entries.sort(key=lambda x: x['date'], reverse=True)
-        for entry in entries:
+        self.entries_data = []  # Summary rows only; view_entry loads full content on demand
+        self.entries_total = entry_count
+        self.entries_page_pending = False
+        self.load_entries_page()
+
+    def load_entries_page(self):
+        # Listing can rescan the entries directory after a save, so pages are fetched on an I/O thread.
+        if self.entries_page_pending or len(self.entries_data) >= self.entries_total:
+            return
+        self.entries_page_pending = True
+        generation, offset = self.entries_generation, len(self.entries_data)
+        self.tasks.submit(self._list_entries, self.current_user, offset, label="Loading entries",
+                          on_done=lambda page: self._entries_page_loaded(generation, page),
+                          on_error=lambda e: self._entries_page_failed(generation, e))
+
+    def _list_entries(self, task, user, offset):
+        return self.core.list_entries(user, offset=offset, limit=self.ENTRIES_PAGE_SIZE)
+
+    @timed('ui.load_entries_page')
+    def _entries_page_loaded(self, generation, page):
+        if generation != self.entries_generation:
+            return
+        self.entries_page_pending = False
+        if not page:
+            self.entries_total = len(self.entries_data)
+        for entry in page:
             date_str = datetime.fromisoformat(entry['date']).strftime('%Y-%m-%d %H:%M')
-            emotion_emoji = {'positive': '😊', 'negative': '😢', 'neutral': '😐'}
-            display_text = f"{date_str} - {entry['title']} {emotion_emoji.get(entry['emotion'], '😐')}"
+            display_text = f"{date_str} - {entry['title']} {self.EMOTION_EMOJI.get(entry['emotion'], '😐')}"
             self.entries_listbox.insert(tk.END, display_text)
-        self.entries_data = entries
+        self.entries_data.extend(page)
+        self.entries_count_label.config(text=f"Showing {len(self.entries_data)} of {self.entries_total}")
+
+    def _entries_page_failed(self, generation, error):
+        if generation == self.entries_generation:
+            self.entries_page_pending = False  # Scrolling again retries
+            self.entries_count_label.config(text=f"Could not load entries: {error}")
+
+    def on_entries_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        # Fetch the next page once the user scrolls near the end of what is loaded.
+        if float(last) > 0.9:
+            self.load_entries_page()
     
+    @timed('ui.view_entry')
     def view_entry(self):
         selection = self.entries_listbox.curselection()
         if not selection:
             return messagebox.showwarning("Warning", "Please select an entry to view.")
-        entry = self.entries_data[selection[0]]
+        entry = self.core.get_entry(self.current_user, self.entries_data[selection[0]]['id'])
+        if entry is None:
+            return messagebox.showerror("Error", "This entry could not be loaded.")
         view_window = tk.Toplevel(self.root)
         view_window.title(f"Entry: {entry['title']}")
         view_window.geometry("700x500")
@@ -305,9 +606,23 @@ class DiaryBot:
         if entry.get('attachments'):
             tk.Label(container, text=f"Attachments: {len(entry['attachments'])} files", font=('Arial', 10), bg=self.colors['white']).pack(pady=(10, 0))
             for attachment in entry['attachments']:
-                filename = os.path.basename(attachment)
-                attachment_button = tk.Button(container, text=filename, command=lambda path=attachment: self.open_attachment(path),bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', padx=15, pady=5, cursor='hand2')
-                attachment_button.pack(pady=(5, 0))
+                filename = self.core.attachments.display_name(attachment)
+                row = tk.Frame(container, bg=self.colors['white'])
+                row.pack(pady=(5, 0))
+                preview = tk.Label(row, bg=self.colors['white'])
+                preview.pack(side='left', padx=(0, 10))
+                attachment_button = tk.Button(row, text=filename, command=lambda path=attachment: self.open_attachment(path),bg=self.colors['primary'], fg='white', font=('Arial', 10),relief='flat', padx=15, pady=5, cursor='hand2')
+                attachment_button.pack(side='left')
+                self.tasks.submit(self._load_thumbnail, attachment, label="Loading preview",
+                                  on_done=lambda thumb, label=preview: self._show_thumbnail(label, thumb), on_error=lambda e: None)
+
+    def _load_thumbnail(self, task, path):
+        return self.core.attachments.thumbnail(path)
+
+    def _show_thumbnail(self, label, thumb):
+        if thumb and label.winfo_exists():
+            label.image = tk.PhotoImage(file=thumb)  # Keep a reference so Tk does not drop the image
+            label.config(image=label.image)
 
     def open_attachment(self, filepath):
         """Open the attached file."""
@@ -317,15 +632,20 @@ class DiaryBot:
             messagebox.showerror("Error", f"Could not open file: {str(e)}")
     
     def search_entries(self):
-        query = self.search_entry.get().strip().lower()
+        query = self.search_entry.get().strip()
         if not query:
             self.search_results.delete(0, tk.END)
             return messagebox.showwarning("Warning", "Please enter a search term.")
         self.search_results.delete(0, tk.END)
-        found_entries = []
-        for entry in self.entries_data:  # Search in loaded entries
-            if query in entry['title'].lower() or query in entry['content'].lower():
-                found_entries.append(entry)
+        self.search_results.insert(tk.END, "Searching...")
+        self.tasks.submit(self._search, self.current_user, query, label="Searching", on_done=self.show_search_results)
+
+    def _search(self, task, user, query):
+        return self.core.search(user, query)
+
+    @timed('ui.show_search_results')
+    def show_search_results(self, found_entries):
+        self.search_results.delete(0, tk.END)
         if not found_entries:
             self.search_results.insert(tk.END, "No matching entries found.")
             return
@@ -334,138 +654,95 @@ class DiaryBot:
             self.search_results.insert(tk.END, f"{date_str} - {entry['title']}")
     
     def generate_analytics(self):
+        if self.analytics_key is None:
+            self.show_analytics_message("Crunching your entries...")
+        # Charts are drawn off the Tk thread into cached images; the window only swaps pictures.
+        self.tasks.submit(self._render_analytics, self.current_user, self.analytics_period.get(),
+                          label="Loading analytics", on_done=self.show_analytics)
+
+    def _render_analytics(self, task, user, period):
+        aggregates = self.core.aggregates(user)
+        if not aggregates.total:
+            return None
+        with aggregates.lock:
+            counts = {k: aggregates.emotion_counts.get(k, 0) for k in ('positive', 'negative', 'neutral')}
+            total = aggregates.total
+        key, paths = self.charts.render(user, aggregates, period)
+        return key, total, counts, paths
+
+    def show_analytics_message(self, text):
         for widget in self.analytics_plot_frame.winfo_children():
             widget.destroy()
-        entries = []
-        for filename in os.listdir('entries'):
-            if filename.startswith(f"{self.current_user}_") and filename.endswith('.json'):
-                try:
-                    with open(f"entries/{filename}", 'r') as f:
-                        entries.append(json.load(f))
-                except json.JSONDecodeError:
-                    continue  # Skip malformed files
-        if not entries:
-            tk.Label(self.analytics_plot_frame, text="No entries found to analyze.", 
-                     font=('Arial', 14), bg=self.colors['white']).pack(pady=50)
-            return
-        positive_count = sum(1 for e in entries if e['emotion'] == 'positive')
-        negative_count = sum(1 for e in entries if e['emotion'] == 'negative')
-        neutral_count = sum(1 for e in entries if e['emotion'] == 'neutral')
+        self.analytics_key = None
+        tk.Label(self.analytics_plot_frame, text=text, font=('Arial', 14), bg=self.colors['white']).pack(pady=50)
+
+    @timed('ui.show_analytics')
+    def show_analytics(self, result):
+        if result is None:
+            return self.show_analytics_message("No entries found to analyze.")
+        key, total, emotion_counts, paths = result
+        if key == self.analytics_key:
+            return  # Nothing changed since the charts on screen were drawn
+        if self.analytics_key is None:
+            for widget in self.analytics_plot_frame.winfo_children():
+                widget.destroy()
+            self.sentiment_text = tk.Text(self.analytics_plot_frame, height=6, font=('Arial', 11), wrap='word')
+            self.sentiment_text.pack(fill='x')
+            charts_row = tk.Frame(self.analytics_plot_frame, bg=self.colors['white'])
+            charts_row.pack(fill='both', expand=True)
+            self.chart_labels = {
+                'emotions': tk.Label(charts_row, bg=self.colors['white']),
+                'scores': tk.Label(charts_row, bg=self.colors['white']),
+                'mood': tk.Label(self.analytics_plot_frame, bg=self.colors['white'])
+            }
+            self.chart_labels['emotions'].pack(side=tk.LEFT, expand=True, padx=10, pady=10)
+            self.chart_labels['scores'].pack(side=tk.RIGHT, expand=True, padx=10, pady=10)
+            self.chart_labels['mood'].pack(expand=True, padx=10, pady=10)
         sentiments_summary = (
             f"Sentiment Summary:\n"
-            f"Total Entries: {len(entries)}\n"
-            f"Positive Entries: {positive_count}\n"
-            f"Negative Entries: {negative_count}\n"
-            f"Neutral Entries: {neutral_count}\n"
+            f"Total Entries: {total}\n"
+            f"Positive Entries: {emotion_counts['positive']}\n"
+            f"Negative Entries: {emotion_counts['negative']}\n"
+            f"Neutral Entries: {emotion_counts['neutral']}\n"
         )
-        sentiment_text = tk.Text(self.analytics_plot_frame, height=10, font=('Arial', 11), wrap='word')
-        sentiment_text.pack(fill='both', expand=True)
-        sentiment_text.insert(tk.END, sentiments_summary)
-        sentiment_text.config(state='disabled')  # Make it read-only
-        emotions = [e['emotion'] for e in entries]
-        emotion_counts = {
-            'positive': emotions.count('positive'),
-            'negative': emotions.count('negative'),
-            'neutral': emotions.count('neutral')
-        }
-        fig1, ax1 = plt.subplots(figsize=(5, 4))
-        labels = [f'{k} ({v})' for k, v in emotion_counts.items() if v > 0]
-        sizes = [v for v in emotion_counts.values() if v > 0]
-        colors = ['#7ED321', '#d9534f', '#4A90E2']  # Positive, Negative, Neutral
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors[:len(sizes)])
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        ax1.set_title('Emotion Distribution')
-        canvas1 = FigureCanvasTkAgg(fig1, master=self.analytics_plot_frame)
-        canvas_widget1 = canvas1.get_tk_widget()
-        canvas_widget1.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
-        canvas1.draw()
-        sentiment_scores = [e['sentiment_score'] for e in entries]
-        fig2, ax2 = plt.subplots(figsize=(5, 4))
-        ax2.hist(sentiment_scores, bins=10, color=self.colors['primary'], edgecolor='black')
-        ax2.set_title('Sentiment Score Distribution')
-        ax2.set_xlabel('Sentiment Score')
-        ax2.set_ylabel('Number of Entries')
-        ax2.grid(True, linestyle='--', alpha=0.7)
-        canvas2 = FigureCanvasTkAgg(fig2, master=self.analytics_plot_frame)
-        canvas_widget2 = canvas2.get_tk_widget()
-        canvas_widget2.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
-        canvas2.draw()
+        self.sentiment_text.config(state='normal')
+        self.sentiment_text.delete(1.0, tk.END)
+        self.sentiment_text.insert(tk.END, sentiments_summary)
+        self.sentiment_text.config(state='disabled')  # Make it read-only
+        for name, label in self.chart_labels.items():
+            label.image = tk.PhotoImage(file=paths[name])  # Keep a reference so Tk does not drop the image
+            label.config(image=label.image)
+        self.analytics_key = key
 
     def export_to_pdf(self):
-        try:
-            filename = f"DiaryExport_{self.current_user}_{datetime.now().strftime('%Y%m%d')}.pdf"
-            c = canvas.Canvas(filename, pagesize=letter)
-            width, height = letter
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(100, height - 50, f"Diary Export - {self.current_user}")
-            y_position = height - 100
-            entries = []
-            for file in os.listdir('entries'):
-                if file.startswith(f"{self.current_user}_") and file.endswith('.json'):
-                    try:
-                        with open(f"entries/{file}", 'r') as f:
-                            entries.append(json.load(f))
-                    except (json.JSONDecodeError, FileNotFoundError):
-                        continue  # Skip problematic files
-            entries.sort(key=lambda x: x['date'])
-            for entry in entries:
-                if y_position < 150:
-                    c.showPage()
-                    y_position = height - 50
-                c.setFont("Helvetica-Bold", 12)
-                date_str = datetime.fromisoformat(entry['date']).strftime('%Y-%m-%d %H:%M')
-                title_text = f"{entry['title']} ({date_str})"
-                c.drawString(100, y_position, title_text)
-                y_position -= 25
-                c.setFont("Helvetica", 9)
-                emotion_text = f"Emotion: {entry.get('emotion', 'N/A')} | Score: {entry.get('sentiment_score', 0):.2f}"
-                c.drawString(100, y_position, emotion_text)
-                y_position -= 20
-                c.setFont("Helvetica", 10)
-                content = entry['content']
-                max_width = 400  # Maximum width in points
-                words = content.split()
-                lines = []
-                current_line = ""
-                for word in words:
-                    test_line = current_line + " " + word if current_line else word
-                    text_width = c.stringWidth(test_line, "Helvetica", 10)
-                    if text_width <= max_width:
-                        current_line = test_line
-                    else:
-                        if current_line:
-                            lines.append(current_line)
-                            current_line = word
-                        else:
-                            # Single word is too long, break it
-                            lines.append(word)         
-                if current_line:
-                    lines.append(current_line)
-                for line in lines:
-                    if y_position < 50:  # Check for page overflow
-                        c.showPage()
-                        y_position = height - 50
-                    c.drawString(100, y_position, line)
-                    y_position -= 15
-                if entry.get('attachments'):
-                    y_position -= 10
-                    c.setFont("Helvetica-Oblique", 9)
-                    attachment_text = f"Attachments: {len(entry['attachments'])} file(s)"
-                    c.drawString(100, y_position, attachment_text)
-                    y_position -= 15
-                y_position -= 10
-                if y_position > 50:
-                    c.line(100, y_position, 500, y_position)
-                    y_position -= 20
-            c.save()
-            messagebox.showinfo("Success", f"PDF exported successfully as {filename}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export PDF: {str(e)}")
-            print(f"PDF Export Error Details: {e}")  # For debugging
+        start, end = self.export_start.get().strip(), self.export_end.get().strip()
+        for value in (start, end):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return messagebox.showerror("Error", f"Invalid date: {value} (use YYYY-MM-DD).")
+        emotions = None if self.export_emotion.get() == 'all' else [self.export_emotion.get()]
+        filename = f"DiaryExport_{self.current_user}_{datetime.now().strftime('%Y%m%d')}.pdf"
+        self.tasks.submit(self._write_pdf, self.current_user, filename, start or None, end or None, emotions,
+                          label="Exporting PDF", cancellable=True, on_done=self._export_done, on_error=self._export_failed)
+
+    def _write_pdf(self, task, user, filename, start, end, emotions):
+        return self.core.export_pdf(user, filename, start, end, emotions, volume_size=self.EXPORT_VOLUME_SIZE,
+                                    workers=self.tasks.cpu_workers, task=task)
+
+    def _export_done(self, files):
+        messagebox.showinfo("Success", f"PDF exported successfully as {', '.join(files)}")
+
+    def _export_failed(self, e):
+        messagebox.showerror("Error", f"Failed to export PDF: {str(e)}")
+        print(f"PDF Export Error Details: {e}")  # For debugging
     
     def run(self):
         self.root.mainloop()
+        self.tasks.shutdown()
+        self.core.close()
 
 if __name__ == "__main__":
-    app = DiaryBot()
-    app.run()
\ No newline at end of file
+    app = DiaryBot(startup_timing='--startup-timing' in sys.argv[1:])
+    app.run()
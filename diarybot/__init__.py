@@ -0,0 +1 @@
+"""Headless building blocks used by the DiaryBot desktop app."""
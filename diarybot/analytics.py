@@ -0,0 +1,183 @@
+"""Per-user analytics aggregates, maintained incrementally as entries are saved.
+
+The Analytics tab renders from these buckets (emotion counts, a fixed
+10-bin sentiment histogram over [-1, 1], and per-day count/score sums that
+roll up into weeks and months) rather than re-reading every entry. They
+remember the store revision they were last checked against; ``sync``
+compares them with the entry summaries only when that revision moves.
+"""
+import json
+import os
+import threading
+from datetime import date
+
+from diarybot.lazy import lazy_import
+from diarybot.metrics import timed
+
+np = lazy_import('numpy')
+
+EMOTIONS = ('positive', 'negative', 'neutral')
+HIST_BINS = 10
+HIST_RANGE = (-1.0, 1.0)
+BIN_WIDTH = (HIST_RANGE[1] - HIST_RANGE[0]) / HIST_BINS
+
+
+def score_bins(scores):
+    """Histogram bin index for each score; shared by the incremental and full paths."""
+    scores = np.asarray(scores, dtype=float)
+    return np.clip(((scores - HIST_RANGE[0]) / BIN_WIDTH).astype(int), 0, HIST_BINS - 1)
+
+
+def period_key(day, period):
+    if period == 'month':
+        return day[:7]
+    if period == 'week':
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f"{year}-W{week:02d}"
+    return day
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` points (shorter at the start of the series)."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return values
+    totals = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (totals[ends] - totals[starts]) / (ends - starts)
+
+
+class Aggregates:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.version = 0
+        self.revision = None  # Store revision the buckets were last checked against
+        self.entries = {}  # id -> [day, emotion, score], so overwrites can be subtracted
+        self.emotion_counts = dict.fromkeys(EMOTIONS, 0)
+        self.histogram = [0] * HIST_BINS
+        self.days = {}  # 'YYYY-MM-DD' -> [count, score_sum]
+        self.dirty = False
+        self._load()
+
+    @classmethod
+    @timed('analytics.load')
+    def for_user(cls, store, user):
+        """Load the user's aggregates, recomputing them if they disagree with the store."""
+        aggregates = cls(os.path.join(store.data_dir, '.aggregates', f"{user}.json"))
+        aggregates.sync(store, user)
+        aggregates.flush()
+        return aggregates
+
+    @timed('analytics.sync')
+    def sync(self, store, user):
+        """Recompute the buckets if an entry changed without passing through ``add`` (another process, crash recovery)."""
+        revision = store.revision(user)  # Read first: a write after this leaves the next sync a new revision
+        with self.lock:
+            if revision == self.revision:
+                return
+            summaries = store.list_summaries(user)
+            if len(summaries) != len(self.entries) or any(self.entries.get(row['id']) != self._record(row) for row in summaries):
+                self.recompute(summaries)
+            self.revision = revision
+            self.dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.version, self.entries, self.days = data['version'], data['entries'], data['days']
+            self.emotion_counts, self.histogram = data['emotion_counts'], data['histogram']
+            self.revision = data.get('revision')
+        except (json.JSONDecodeError, FileNotFoundError, KeyError):
+            pass
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': self.version, 'revision': self.revision, 'entries': self.entries, 'days': self.days,
+                           'emotion_counts': self.emotion_counts, 'histogram': self.histogram}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def _apply(self, day, emotion, score, sign):
+        self.emotion_counts[emotion] = self.emotion_counts.get(emotion, 0) + sign
+        self.histogram[int(score_bins([score])[0])] += sign
+        bucket = self.days.setdefault(day, [0, 0.0])
+        bucket[0] += sign
+        bucket[1] += sign * score
+        if bucket[0] == 0:
+            del self.days[day]
+
+    @staticmethod
+    def _record(entry):
+        return [entry['date'][:10], entry.get('emotion') or 'neutral', entry.get('sentiment_score') or 0.0]
+
+    def add(self, entry):
+        """Count a newly saved (or re-saved) entry."""
+        with self.lock:
+            self._remove(entry['id'])
+            record = self._record(entry)
+            self.entries[entry['id']] = record
+            self._apply(*record, 1)
+            self.version += 1
+            self.dirty = True
+
+    def remove(self, entry_id):
+        with self.lock:
+            if self._remove(entry_id):
+                self.version += 1
+                self.dirty = True
+
+    def _remove(self, entry_id):
+        record = self.entries.pop(entry_id, None)
+        if record is not None:
+            self._apply(*record, -1)
+        return record is not None
+
+    @timed('analytics.recompute')
+    def recompute(self, summaries):
+        """Rebuild every bucket from entry summaries in one vectorised pass."""
+        with self.lock:
+            ids = [row['id'] for row in summaries]
+            days = np.array([row['date'][:10] for row in summaries], dtype=str)
+            emotions = np.array([row.get('emotion') or 'neutral' for row in summaries], dtype=str)
+            scores = np.fromiter((row.get('sentiment_score') or 0.0 for row in summaries), dtype=float, count=len(summaries))
+            self.entries = {entry_id: [day, emotion, score] for entry_id, day, emotion, score
+                            in zip(ids, days.tolist(), emotions.tolist(), scores.tolist())}
+            self.emotion_counts = dict.fromkeys(EMOTIONS, 0)
+            if len(ids):
+                labels, counts = np.unique(emotions, return_counts=True)
+                self.emotion_counts.update(zip(labels.tolist(), counts.tolist()))
+            self.histogram = np.bincount(score_bins(scores), minlength=HIST_BINS).tolist()
+            self.days = {}
+            if len(ids):
+                unique_days, inverse = np.unique(days, return_inverse=True)
+                day_counts = np.bincount(inverse)
+                day_sums = np.bincount(inverse, weights=scores)
+                self.days = {day: [int(count), float(total)] for day, count, total
+                             in zip(unique_days.tolist(), day_counts, day_sums)}
+            self.version += 1
+            self.dirty = True
+
+    @property
+    def total(self):
+        return len(self.entries)
+
+    def series(self, period='day'):
+        """Return ``(labels, counts, mean_scores)`` per day, week or month, oldest first."""
+        with self.lock:
+            buckets = {}
+            for day, (count, score_sum) in self.days.items():
+                bucket = buckets.setdefault(period_key(day, period), [0, 0.0])
+                bucket[0] += count
+                bucket[1] += score_sum
+        labels = sorted(buckets)
+        counts = np.array([buckets[label][0] for label in labels], dtype=int)
+        sums = np.array([buckets[label][1] for label in labels], dtype=float)
+        return labels, counts, sums / np.maximum(counts, 1)
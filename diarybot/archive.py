@@ -0,0 +1,244 @@
+"""Compact monthly archive segments for old entries of the JSON-directory store.
+
+``JsonDirStore.compact`` moves entries dated before a cutoff out of their
+one-file-per-entry JSON into ``.archive/{user}/{YYYY-MM}.seg``. A segment keeps
+the list-view metadata column-wise -- dates, sentiment scores and emotions as
+packed little-endian arrays, ids, titles and the remaining fields as one
+compressed JSON block -- followed by zlib-compressed blocks of entry content:
+
+    header | dates int64 | scores float64 | block offsets uint64 | content block per entry uint32
+           | emotion codes uint8 | metadata | content blocks
+
+Segments are memory-mapped and never modified in place; listing, search sync
+and analytics read only the metadata, and a content block is inflated only
+when one of its entries is opened.
+"""
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from diarybot.metrics import count
+
+MAGIC = b'DBSEG\x00\x00\x01'
+HEADER = struct.Struct('<8sIIII')  # magic, entries, content blocks, metadata length, reserved
+BLOCK_BYTES = 64 * 1024  # Uncompressed content per block
+COLUMNS = ('id', 'title', 'content', 'date', 'emotion', 'sentiment_score')
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(date):
+    """Microseconds since 1970 for an ISO date string that formats back identically, else None."""
+    try:
+        when = datetime.fromisoformat(date)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is not None or when.isoformat() != date:
+        return None
+    return (when - EPOCH) // MICROSECOND
+
+
+def _from_micros(micros):
+    return (EPOCH + micros * MICROSECOND).isoformat()
+
+
+def archivable(entry):
+    """Whether ``entry`` can go into a segment and be read back unchanged."""
+    score = entry.get('sentiment_score')
+    return (all(field in entry for field in COLUMNS)
+            and isinstance(entry['content'], str)
+            and (entry['emotion'] is None or isinstance(entry['emotion'], str))
+            and (score is None or type(score) in (int, float))
+            and _to_micros(entry['date']) is not None)
+
+
+def _packed(typecode, values):
+    column = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes() + b'\0' * (-len(column) * column.itemsize % 8)
+
+
+def _aligned(size):
+    return size + -size % 8
+
+
+def write_segment(path, entries):
+    """Write ``entries`` (archivable, ordered by date) as the segment at ``path``, replacing it atomically."""
+    emotions = [None]
+    codes, block_of, blocks, pending, pending_bytes = [], [], [], [], 0
+    for entry in entries:
+        if entry['emotion'] not in emotions:
+            emotions.append(entry['emotion'])
+        codes.append(emotions.index(entry['emotion']))
+        block_of.append(len(blocks))
+        pending.append(entry['content'])
+        pending_bytes += len(entry['content'])
+        if pending_bytes >= BLOCK_BYTES:
+            blocks.append(zlib.compress(json.dumps(pending).encode('utf-8')))
+            pending, pending_bytes = [], 0
+    if pending:
+        blocks.append(zlib.compress(json.dumps(pending).encode('utf-8')))
+    offsets = [0]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    meta = zlib.compress(json.dumps({
+        'ids': [entry['id'] for entry in entries],
+        'titles': [entry['title'] for entry in entries],
+        'emotions': emotions,
+        'extra': [{key: value for key, value in entry.items() if key not in COLUMNS} for entry in entries]
+    }).encode('utf-8'))
+    scores = [float('nan') if entry['sentiment_score'] is None else entry['sentiment_score'] for entry in entries]
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(entries), len(blocks), len(meta), 0))
+            f.write(_packed('q', [_to_micros(entry['date']) for entry in entries]))
+            f.write(_packed('d', scores))
+            f.write(_packed('Q', offsets))
+            f.write(_packed('I', block_of))
+            f.write(_packed('B', codes))
+            f.write(meta + b'\0' * (-len(meta) % 8))
+            f.writelines(blocks)
+            f.flush()
+            os.fsync(f.fileno())  # The JSON files are deleted once this is in place
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Segment:
+    """One read-only, memory-mapped segment file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.version = os.fstat(f.fileno()).st_mtime_ns  # Segments are replaced, never modified in place
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, blocks, meta_length, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"Not a DiaryBot archive segment: {path}")
+        self.position = HEADER.size
+        self.dates = self._column('q', n)
+        self.scores = self._column('d', n)
+        self.offsets = self._column('Q', blocks + 1)
+        self.block_of = self._column('I', n)
+        self.codes = self._column('B', n)
+        self.meta = json.loads(zlib.decompress(self.map[self.position:self.position + meta_length]))
+        self.content_start = self.position + _aligned(meta_length)
+        self.cached = (None, None)  # Last inflated block, so sequential reads inflate each block once
+
+    def _column(self, typecode, length):
+        column = array.array(typecode)
+        end = self.position + length * column.itemsize
+        column.frombytes(self.map[self.position:end])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        self.position = _aligned(end)
+        return column
+
+    def __len__(self):
+        return len(self.dates)
+
+    def summary(self, row):
+        score = self.scores[row]
+        return {'id': self.meta['ids'][row], 'date': _from_micros(self.dates[row]), 'title': self.meta['titles'][row],
+                'emotion': self.meta['emotions'][self.codes[row]], 'sentiment_score': None if score != score else score}
+
+    def content(self, row):
+        block = self.block_of[row]
+        cached_block, contents = self.cached
+        if cached_block != block:
+            start, end = self.content_start + self.offsets[block], self.content_start + self.offsets[block + 1]
+            contents = json.loads(zlib.decompress(self.map[start:end]))
+            self.cached = (block, contents)
+            count('archive.blocks_inflated')
+        return contents[row - bisect.bisect_left(self.block_of, block)]
+
+    def entry(self, row):
+        entry = self.summary(row)
+        entry['content'] = self.content(row)
+        entry.update(self.meta['extra'][row])
+        return entry
+
+    def entries(self):
+        return [self.entry(row) for row in range(len(self))]
+
+
+class UserArchive:
+    """One user's segments as they were on disk at ``version``."""
+
+    def __init__(self, directory, version):
+        self.version = version
+        self.segments = {}
+        self.rows = {}  # Entry id -> (segment, row)
+        self.summaries = []
+        if version is None:
+            return
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.seg'):
+                continue
+            segment = self.segments[name[:-4]] = Segment(os.path.join(directory, name))
+            for row in range(len(segment)):
+                summary = segment.summary(row)
+                self.rows[summary['id']] = (segment, row)
+                self.summaries.append(summary)
+        self.summaries.sort(key=lambda x: x['date'])
+
+    def get(self, entry_id):
+        found = self.rows.get(entry_id)
+        return found[0].entry(found[1]) if found else None
+
+
+class Archive:
+    """The ``.archive`` directory of a store: one subdirectory of monthly segments per user."""
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.opened = {}
+
+    def user_dir(self, user):
+        return os.path.join(self.root, user)
+
+    def open(self, user):
+        """The user's archive, re-read whenever a segment has been written since it was last opened."""
+        try:
+            version = os.stat(self.user_dir(user)).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        with self.lock:
+            archive = self.opened.get(user)
+            if archive is None or archive.version != version:
+                archive = self.opened[user] = UserArchive(self.user_dir(user), version)
+        return archive
+
+    def month(self, user, month):
+        """Every entry in the user's ``YYYY-MM`` segment."""
+        path = os.path.join(self.user_dir(user), f"{month}.seg")
+        return Segment(path).entries() if os.path.exists(path) else []
+
+    def write(self, user, month, entries):
+        os.makedirs(self.user_dir(user), exist_ok=True)
+        with self.lock:
+            self.opened.pop(user, None)  # Unmap before the segment is replaced
+        write_segment(os.path.join(self.user_dir(user), f"{month}.seg"), entries)
+
+    def users(self):
+        try:
+            return [name for name in os.listdir(self.root) if os.path.isdir(self.user_dir(name))]
+        except FileNotFoundError:
+            return []
+
+    def close(self):
+        with self.lock:
+            self.opened.clear()
@@ -0,0 +1,163 @@
+"""Content-addressed attachment store.
+
+Files are copied in chunks into ``attachments/objects/<xx>/<sha256><ext>`` so
+the same file attached twice is stored once. ``refs.db`` records which entries
+reference each blob; ``gc`` removes blobs nothing references any more.
+Image thumbnails are generated on demand (with Pillow, if installed) and cached
+under ``attachments/thumbs/``.
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from diarybot.lazy import available, lazy_import
+
+Image = lazy_import('PIL.Image')  # Optional: no previews without Pillow
+
+CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+THUMBNAIL_SIZE = (160, 160)
+
+
+class AttachmentStore:
+    def __init__(self, root='attachments'):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.thumbs_dir = os.path.join(root, 'thumbs')
+        for folder in (self.objects_dir, self.thumbs_dir):
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'refs.db'), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS refs (blob TEXT NOT NULL, user TEXT NOT NULL, entry_id TEXT NOT NULL, '
+                              'PRIMARY KEY (blob, user, entry_id))')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS refs_entry ON refs (user, entry_id)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS names (blob TEXT PRIMARY KEY, name TEXT NOT NULL)')
+
+    def is_blob(self, path):
+        return os.path.normpath(path).startswith(os.path.normpath(self.objects_dir) + os.sep)
+
+    def put(self, src_path, task=None):
+        """Copy ``src_path`` into the store and return the blob path.
+
+        The file is streamed in chunks while being hashed; if an identical blob
+        already exists the copy is discarded. ``task`` (a ``diarybot.tasks.Task``)
+        receives byte progress and may cancel the copy.
+        """
+        total = os.path.getsize(src_path)
+        ext = os.path.splitext(src_path)[1].lower()
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.tmp')
+        try:
+            with open(src_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                copied = 0
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+                    copied += len(chunk)
+                    if task:
+                        task.check()
+                        task.report(copied, total, f"Copying {os.path.basename(src_path)}")
+            name = digest.hexdigest()
+            blob_dir = os.path.join(self.objects_dir, name[:2])
+            os.makedirs(blob_dir, exist_ok=True)
+            blob_path = os.path.join(blob_dir, f"{name}{ext}")
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+                os.utime(blob_path)  # Restart the gc grace period for the reused blob
+            else:
+                os.replace(tmp_path, blob_path)
+            with self.lock, self.conn:
+                self.conn.execute('INSERT OR IGNORE INTO names (blob, name) VALUES (?, ?)',
+                                  (os.path.normpath(blob_path), os.path.basename(src_path)))
+            return blob_path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def display_name(self, path):
+        """The original file name of a blob (the file name itself for other paths)."""
+        with self.lock:
+            row = self.conn.execute('SELECT name FROM names WHERE blob = ?', (os.path.normpath(path),)).fetchone()
+        return row[0] if row else os.path.basename(path)
+
+    def set_refs(self, user, entry_id, paths):
+        """Record the blobs an entry references, replacing what it referenced before."""
+        blobs = {os.path.normpath(path) for path in paths if self.is_blob(path)}
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM refs WHERE user = ? AND entry_id = ?', (user, entry_id))
+            self.conn.executemany('INSERT INTO refs (blob, user, entry_id) VALUES (?, ?, ?)',
+                                  [(blob, user, entry_id) for blob in blobs])
+
+    def remove_refs(self, user, entry_id):
+        self.set_refs(user, entry_id, [])
+
+    def refcount(self, path):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM refs WHERE blob = ?', (os.path.normpath(path),)).fetchone()[0]
+
+    def rebuild_refs(self, store):
+        """Recompute every reference from the entries in ``store``."""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM refs')
+        for user in store.users():
+            for entry in store.iter_entries(user):
+                self.set_refs(user, entry['id'], entry.get('attachments', []))
+
+    def gc(self, grace_seconds=24 * 3600):
+        """Delete unreferenced blobs (and their thumbnails) older than ``grace_seconds``.
+
+        The grace period protects files attached to an entry that has not been saved yet.
+        """
+        with self.lock:
+            referenced = {row[0] for row in self.conn.execute('SELECT DISTINCT blob FROM refs')}
+        cutoff = time.time() - grace_seconds
+        removed = []
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(dirpath, filename))
+                if path in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                removed.append(path)
+                with self.lock, self.conn:
+                    self.conn.execute('DELETE FROM names WHERE blob = ?', (path,))
+                thumb = self._thumbnail_path(path)
+                if os.path.exists(thumb):
+                    os.remove(thumb)
+        return removed
+
+    def _thumbnail_path(self, path):
+        if self.is_blob(path):
+            key = os.path.splitext(os.path.basename(path))[0]
+        else:
+            # Attachments from before the store: key on path and modification state.
+            st = os.stat(path)
+            key = hashlib.sha256(f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}".encode('utf-8')).hexdigest()
+        return os.path.join(self.thumbs_dir, f"{key}.png")
+
+    def thumbnail(self, path):
+        """Return a cached PNG thumbnail for an image attachment, or None."""
+        if not path.lower().endswith(IMAGE_EXTENSIONS) or not os.path.exists(path) or not available(Image):
+            return None
+        thumb = self._thumbnail_path(path)
+        if not os.path.exists(thumb):
+            with Image.open(path) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                if image.mode not in ('RGB', 'RGBA', 'L', 'P'):
+                    image = image.convert('RGB')
+                tmp_path = f"{thumb}.{threading.get_ident()}.tmp"
+                image.save(tmp_path, 'PNG')
+            os.replace(tmp_path, thumb)
+        return thumb
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,125 @@
+"""Analytics charts rendered to cached PNG images, away from the Tk thread.
+
+``AnalyticsCharts`` keeps a single set of matplotlib figures (plain ``Figure``
+objects on the Agg canvas, never registered with pyplot) and updates their
+artists in place for each render. Images are cached under a key made from the
+aggregates' version and charted numbers, so showing unchanged data again
+costs a file lookup instead of a redraw.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+
+from diarybot.analytics import BIN_WIDTH, EMOTIONS, HIST_BINS, HIST_RANGE, moving_average
+from diarybot.lazy import lazy_import
+from diarybot.metrics import count, timed
+
+mpl_figure = lazy_import('matplotlib.figure')
+backend_agg = lazy_import('matplotlib.backends.backend_agg')
+
+CHART_NAMES = ('emotions', 'scores', 'mood')
+EMOTION_COLORS = {'positive': '#7ED321', 'negative': '#d9534f', 'neutral': '#4A90E2'}
+PRIMARY, ACCENT = '#4A90E2', '#9013fe'
+MOVING_AVERAGE_WINDOW = 4
+
+
+def chart_key(aggregates, period):
+    """Cache key for one rendering: the aggregates' version plus a digest of the numbers behind it."""
+    with aggregates.lock:
+        data = [aggregates.version, aggregates.total, aggregates.emotion_counts, aggregates.histogram, period]
+    digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f"v{aggregates.version}-{period}-{digest}"
+
+
+class AnalyticsCharts:
+    def __init__(self, cache_dir, dpi=100):
+        self.cache_dir = cache_dir
+        self.dpi = dpi
+        self.lock = threading.Lock()  # The figures are shared; one render at a time
+        self.figures = None
+
+    def _figure(self, width, height):
+        figure = mpl_figure.Figure(figsize=(width, height), dpi=self.dpi)
+        backend_agg.FigureCanvasAgg(figure)
+        return figure, figure.add_subplot()
+
+    def _build(self):
+        emotions_fig, self.emotions_ax = self._figure(4.5, 3)
+        scores_fig, ax = self._figure(4.5, 3)
+        bin_lefts = [HIST_RANGE[0] + i * BIN_WIDTH for i in range(HIST_BINS)]
+        self.bars = ax.bar(bin_lefts, [0] * HIST_BINS, width=BIN_WIDTH, align='edge', color=PRIMARY, edgecolor='black')
+        ax.set_title('Sentiment Score Distribution')
+        ax.set_xlabel('Sentiment Score')
+        ax.set_ylabel('Number of Entries')
+        ax.grid(True, linestyle='--', alpha=0.7)
+        self.scores_ax = ax
+        mood_fig, ax = self._figure(9, 2.6)
+        self.mean_line, = ax.plot([], [], marker='.', color=PRIMARY, alpha=0.5)
+        self.average_line, = ax.plot([], [], color=ACCENT, linewidth=2, label=f'Moving average ({MOVING_AVERAGE_WINDOW})')
+        ax.axhline(0, color='gray', linewidth=0.8)
+        ax.set_ylim(-1, 1)
+        ax.set_title('Mood Over Time')
+        ax.grid(True, linestyle='--', alpha=0.7)
+        self.mood_ax = ax
+        self.figures = dict(zip(CHART_NAMES, (emotions_fig, scores_fig, mood_fig)))
+
+    def prepare(self):
+        """Create the figures (importing matplotlib) ahead of the first render."""
+        with self.lock:
+            if self.figures is None:
+                self._build()
+
+    def _update(self, counts, histogram, labels, means, period):
+        # A pie's wedge count varies, so it is redrawn in its axes; the other charts reuse their artists.
+        ax = self.emotions_ax
+        ax.clear()
+        shown = [emotion for emotion in EMOTIONS if counts[emotion] > 0]
+        ax.pie([counts[e] for e in shown], labels=[f'{e} ({counts[e]})' for e in shown], autopct='%1.1f%%',
+               startangle=90, colors=[EMOTION_COLORS[e] for e in shown])
+        ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+        ax.set_title('Emotion Distribution')
+        for bar, height in zip(self.bars, histogram):
+            bar.set_height(height)
+        self.scores_ax.set_ylim(0, max(max(histogram), 1) * 1.05)
+        x = range(len(labels))
+        self.mean_line.set_data(x, means)
+        self.mean_line.set_label(f'Mean score per {period}')
+        self.average_line.set_data(x, moving_average(means, MOVING_AVERAGE_WINDOW))
+        ax = self.mood_ax
+        ax.set_xlim(-0.5, max(len(labels) - 0.5, 0.5))
+        ticks = list(range(0, len(labels), max(1, len(labels) // 8)))
+        ax.set_xticks(ticks)
+        ax.set_xticklabels([labels[i] for i in ticks], fontsize=8)
+        ax.legend(loc='upper left', fontsize=8)
+
+    def paths(self, user, key):
+        return {name: os.path.join(self.cache_dir, f"{user}-{key}-{name}.png") for name in CHART_NAMES}
+
+    @timed('charts.render')
+    def render(self, user, aggregates, period):
+        """Return ``(key, {chart name: PNG path})``, drawing only when the key has no cached images."""
+        key = chart_key(aggregates, period)
+        paths = self.paths(user, key)
+        if all(os.path.exists(path) for path in paths.values()):
+            count('charts.cache_hits')
+            return key, paths
+        with aggregates.lock:
+            counts = {emotion: aggregates.emotion_counts.get(emotion, 0) for emotion in EMOTIONS}
+            histogram = list(aggregates.histogram)
+        labels, _, means = aggregates.series(period)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.lock:
+            if self.figures is None:
+                self._build()
+            self._update(counts, histogram, labels, means, period)
+            for name, figure in self.figures.items():
+                tmp_path = f"{paths[name]}.{threading.get_ident()}.tmp"
+                figure.savefig(tmp_path, format='png')
+                os.replace(tmp_path, paths[name])
+        # Older renderings for this user and period are never shown again.
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{glob.escape(user)}-v*-{period}-*.png")):
+            if path not in paths.values():
+                os.remove(path)
+        return key, paths
@@ -0,0 +1,204 @@
+"""Command-line entry point: ``python -m diarybot <command>``.
+
+Runs without a display, so bulk imports, exports and maintenance can be
+scripted on headless servers.
+"""
+import argparse
+import getpass
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+from diarybot.core import DiaryCore
+from diarybot.metrics import metrics
+from diarybot.storage import migrate, open_store
+from diarybot.users import AuthError
+from diarybot.voice import AUDIO_EXTENSIONS, VoiceError, open_engine
+
+
+def read_records(path):
+    """Entry dicts from a .json (object or list), .jsonl, or plain-text file."""
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith('.json'):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        yield from data if isinstance(data, list) else [data]
+    else:
+        # A plain text file becomes one entry titled after the file, dated by its mtime.
+        with open(path, 'r') as f:
+            content = f.read().strip()
+        yield {
+            'title': os.path.splitext(os.path.basename(path))[0],
+            'content': content,
+            'date': datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+        }
+
+
+def cmd_register(core, args):
+    password = getpass.getpass(f"Password for {args.user}: ")
+    core.register(args.user, password)
+    print(f"Created account {args.user}")
+
+
+def cmd_import(core, args):
+    records = (record for path in args.files for record in read_records(path))
+    imported = core.import_entries(args.user, records, args.batch_size, args.workers)
+    print(f"Imported {imported} entries for {args.user}")
+
+
+def cmd_transcribe(core, args):
+    paths = []
+    for path in args.files:
+        if os.path.isdir(path):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(AUDIO_EXTENSIONS)))
+        else:
+            paths.append(path)
+    imported = core.import_audio(args.user, paths, open_engine(args.engine), args.workers)
+    print(f"Transcribed {imported} of {len(paths)} recording(s) into entries for {args.user}")
+
+
+def cmd_export(core, args):
+    if args.format == 'jsonl':
+        output = args.output or f"DiaryExport_{args.user}_{datetime.now().strftime('%Y%m%d')}.jsonl"
+        if output == '-':
+            core.export_json(args.user, sys.stdout)
+            return
+        with open(output, 'w') as f:
+            written = core.export_json(args.user, f)
+        print(f"Exported {written} entries to {output}")
+        return
+    output = args.output or f"DiaryExport_{args.user}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    files = core.export_pdf(args.user, output, args.start, args.end, args.emotion, args.volume_size, args.workers)
+    print(f"Exported to {', '.join(files)}")
+
+
+def cmd_search(core, args):
+    for result in core.search(args.user, args.query, args.limit):
+        print(f"{result['date'][:10]}  {result['score']:6.2f}  {result['emotion'] or '':8}  {result['title']}")
+
+
+def cmd_stats(core, args):
+    for user in args.user or core.store.users():
+        aggregates = core.aggregates(user)
+        counts = aggregates.emotion_counts
+        print(f"{user}: {aggregates.total} entries "
+              f"(positive {counts.get('positive', 0)}, negative {counts.get('negative', 0)}, neutral {counts.get('neutral', 0)})")
+        labels, entry_counts, mean_scores = aggregates.series('month')
+        for label, count, mean in zip(labels, entry_counts, mean_scores):
+            print(f"  {label}  {count:5d} entries  mean score {mean:+.2f}")
+
+
+def cmd_rescore(core, args):
+    for user in args.user or core.store.users():
+        stats = core.rescore(user, batch_size=args.batch_size, workers=args.workers)
+        print(f"{user}: scanned {stats['scanned']}, cached {stats['cached']}, "
+              f"scored {stats['scored']}, updated {stats['updated']}")
+
+
+def cmd_migrate(core, args):
+    source, target = open_store(args.source), open_store(args.target)
+    try:
+        copied = migrate(source, target, args.user, args.batch_size)
+    finally:
+        source.close()
+        target.close()
+    print(f"Migrated {copied} entries from {args.source} to {args.target}")
+
+
+def cmd_archive(core, args):
+    before = args.before or (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    for user in args.user or core.store.users():
+        moved = core.archive_entries(user, before)
+        print(f"{user}: archived {moved} entries dated before {before}")
+
+
+def cmd_gc(core, args):
+    removed = core.collect_attachments(args.grace_hours * 3600)
+    print(f"Removed {len(removed)} unused attachment(s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m diarybot', description="Headless DiaryBot tools.")
+    parser.add_argument('--store', help="entry store spec, e.g. sqlite:diary.db (default: $DIARYBOT_STORE or json:entries)")
+    parser.add_argument('--metrics', metavar='FILE', help="write operation timings afterwards (.prom for Prometheus text, else JSON)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('register', help="create a user account")
+    p.add_argument('user')
+    p.set_defaults(func=cmd_register)
+
+    p = commands.add_parser('import', help="bulk-import entries from .json, .jsonl or text files")
+    p.add_argument('user')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--batch-size', type=int, default=500)
+    p.add_argument('--workers', type=int)
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser('transcribe', help="turn audio recordings (WAV, AIFF, FLAC) into entries")
+    p.add_argument('user')
+    p.add_argument('files', nargs='+', help="audio files or directories of them")
+    p.add_argument('--engine', help="e.g. vosk:models/vosk-en, whisper:base (default: $DIARYBOT_VOICE_ENGINE or google)")
+    p.add_argument('--workers', type=int)
+    p.set_defaults(func=cmd_transcribe)
+
+    p = commands.add_parser('export', help="export a user's entries to PDF or JSON lines")
+    p.add_argument('user')
+    p.add_argument('--format', choices=('pdf', 'jsonl'), default='pdf')
+    p.add_argument('--output', help="output file ('-' for stdout with jsonl)")
+    p.add_argument('--from', dest='start', metavar='YYYY-MM-DD')
+    p.add_argument('--to', dest='end', metavar='YYYY-MM-DD')
+    p.add_argument('--emotion', action='append', choices=('positive', 'negative', 'neutral'))
+    p.add_argument('--volume-size', type=int, help="entries per PDF volume, rendered in parallel")
+    p.add_argument('--workers', type=int)
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser('search', help="search a user's entries")
+    p.add_argument('user')
+    p.add_argument('query')
+    p.add_argument('--limit', type=int, default=20)
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser('stats', help="entry counts and monthly mood")
+    p.add_argument('user', nargs='*')
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser('rescore', help="re-run sentiment analysis over stored entries")
+    p.add_argument('user', nargs='*')
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--workers', type=int)
+    p.set_defaults(func=cmd_rescore)
+
+    p = commands.add_parser('migrate', help="copy entries between storage backends")
+    p.add_argument('source', help="e.g. json:entries")
+    p.add_argument('target', help="e.g. sqlite:diary.db")
+    p.add_argument('--user', action='append', help="only migrate this user (repeatable)")
+    p.add_argument('--batch-size', type=int, default=500)
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser('archive', help="compact old entries into monthly archive segments (json store)")
+    p.add_argument('user', nargs='*')
+    p.add_argument('--before', metavar='YYYY-MM-DD', help="archive entries dated before this (default: one year ago)")
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser('gc', help="delete attachments no entry references")
+    p.add_argument('--grace-hours', type=float, default=24)
+    p.set_defaults(func=cmd_gc)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    core = DiaryCore(open_store(args.store))
+    try:
+        args.func(core, args)
+    except (AuthError, VoiceError) as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        core.close()
+        if args.metrics:
+            metrics.dump(args.metrics)
@@ -0,0 +1,280 @@
+"""GUI-free DiaryBot API: users, entries, search, analytics and export.
+
+The Tk app and the ``python -m diarybot`` command line are both thin clients
+of ``DiaryCore``. Every write goes through ``save_entries`` so the derived
+data (attachment references, search index, analytics aggregates) stays in step.
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from diarybot.analytics import Aggregates
+from diarybot.attachments import AttachmentStore
+from diarybot.export import export_pdf
+from diarybot.search import SearchIndex
+from diarybot.sentiment import analyze, classify, rescore, score_batch
+from diarybot.storage import open_store
+from diarybot.tasks import worker_context
+from diarybot.users import UserStore
+from diarybot.voice import transcribe_file
+
+# ``YYYYmmdd_HHMMSS`` with an optional ``-N`` from ``free_id``; the JSON store finds entries by this shape.
+ENTRY_ID_RE = re.compile(r'(\d{8}_\d{6})(?:-\d+)?')
+
+
+class DiaryCore:
+    def __init__(self, store=None, users_root='users', attachments_root='attachments'):
+        self.store = store if store is not None else open_store()
+        self.users = UserStore(users_root)
+        self.attachments = AttachmentStore(attachments_root)
+        self.lock = threading.Lock()
+        self.id_lock = threading.Lock()  # Held from picking a new entry's id until it is saved
+        self._search_indexes = {}
+        self._aggregates = {}
+
+    # Users
+
+    def register(self, username, password):
+        self.users.register(username, password)
+
+    def login(self, username, password, remember=False):
+        """Raise ``AuthError`` unless the credentials are valid; ``remember`` keeps the user signed in."""
+        self.users.authenticate(username, password)
+        if remember:
+            self.users.remember(username)
+
+    def resume_session(self):
+        """The user still signed in from an earlier run, or ``None``."""
+        return self.users.resume()
+
+    def end_session(self):
+        self.users.forget()
+
+    # Entries
+
+    @staticmethod
+    def new_entry(title, content, attachments=(), when=None):
+        """Build an unsaved entry; call ``score`` (or set the sentiment fields) before saving."""
+        when = when or datetime.now()
+        return {
+            'id': when.strftime('%Y%m%d_%H%M%S'),
+            'title': title,
+            'content': content,
+            'date': when.isoformat(),
+            'attachments': list(attachments)
+        }
+
+    @staticmethod
+    def score(entry):
+        entry['sentiment_score'], entry['emotion'] = analyze(entry['content'])
+        return entry
+
+    def free_id(self, user, entry_id, taken=()):
+        """``entry_id``, or ``entry_id-1``, ``-2``, ... if an entry (or one in ``taken``) already uses it."""
+        # Date-derived ids collide for entries written in the same second (or dated by day only).
+        candidate, n = entry_id, 0
+        while candidate in taken or self.store.get(user, candidate) is not None:
+            n += 1
+            candidate = f"{entry_id}-{n}"
+        return candidate
+
+    def add_entry(self, user, entry):
+        """Save a new entry without overwriting an existing one that has the same id; returns the entry."""
+        with self.id_lock:
+            entry['id'] = self.free_id(user, entry['id'])
+            self.store.save_many(user, [entry])
+        self.entries_changed(user, [entry])
+        return entry
+
+    def save_entry(self, user, entry):
+        self.save_entries(user, [entry])
+
+    def save_entries(self, user, entries):
+        self.store.save_many(user, entries)
+        self.entries_changed(user, entries)
+
+    def entries_changed(self, user, entries):
+        """Fold entries already written to the store into the derived data."""
+        aggregates = self.aggregates(user, sync=False)
+        with self.lock:
+            index = self._search_indexes.get(user)
+        # An index that is not loaded picks new entries up when it is next synced.
+        versions = self.store.versions(user, [entry['id'] for entry in entries]) if index else {}
+        for entry in entries:
+            self.attachments.set_refs(user, entry['id'], entry.get('attachments', []))
+            aggregates.add(entry)
+            if index:
+                index.add(entry, versions.get(entry['id']))
+
+    def get_entry(self, user, entry_id):
+        return self.store.get(user, entry_id)
+
+    def count_entries(self, user):
+        return self.store.count(user)
+
+    def list_entries(self, user, reverse=True, offset=0, limit=None):
+        return self.store.list_summaries(user, reverse, offset, limit)
+
+    def iter_entries(self, user, reverse=False):
+        return self.store.iter_entries(user, reverse)
+
+    # Search and analytics
+
+    def search_index(self, user):
+        with self.lock:
+            index = self._search_indexes.get(user)
+        if index is None:
+            index = SearchIndex.for_user(self.store, user)
+            with self.lock:
+                index = self._search_indexes.setdefault(user, index)
+        return index
+
+    def search(self, user, query, limit=100):
+        index = self.search_index(user)
+        index.sync(self.store, user)  # Picks up entries another process or crash recovery rewrote
+        return index.search(query, limit)
+
+    def aggregates(self, user, sync=True):
+        """The user's analytics aggregates, first checked against the store unless ``sync`` is False."""
+        with self.lock:
+            aggregates = self._aggregates.get(user)
+            if aggregates is None:
+                aggregates = self._aggregates[user] = Aggregates.for_user(self.store, user)
+                return aggregates
+        if sync:
+            aggregates.sync(self.store, user)
+        return aggregates
+
+    def rescore(self, user, task=None, batch_size=256, workers=None):
+        self.search_index(user)  # Make sure changed emotions reach the persisted index
+        stats = rescore(self.store, user, batch_size, workers, task=task,
+                        on_update=lambda entries: self.entries_changed(user, entries))
+        self.flush(user)
+        return stats
+
+    # Import and export
+
+    def import_entries(self, user, records, batch_size=500, workers=None, task=None):
+        """Bulk-save entry dicts (``title`` and ``content`` required; other fields optional).
+
+        Missing sentiment is scored in a process pool one batch at a time and
+        attachment paths are copied into the attachment store. A supplied ``id``
+        is kept only if it has the ``YYYYmmdd_HHMMSS[-N]`` shape and is not taken;
+        otherwise the entry gets a fresh one. Returns the number imported.
+        """
+        imported = 0
+        batch = []
+        taken = set()
+
+        def write(pool):
+            nonlocal imported
+            unscored = [entry for entry in batch if entry.get('sentiment_score') is None]
+            if unscored:
+                chunk = max(1, len(unscored) // ((workers or os.cpu_count() or 1) * 2))
+                texts = [entry['content'] for entry in unscored]
+                polarities = [p for part in pool.map(score_batch, [texts[i:i + chunk] for i in range(0, len(texts), chunk)]) for p in part]
+                for entry, polarity in zip(unscored, polarities):
+                    entry['sentiment_score'], entry['emotion'] = polarity, classify(polarity)
+            self.save_entries(user, batch)
+            imported += len(batch)
+            batch.clear()
+            if task:
+                task.report(imported, None, f"Imported {imported} entries")
+
+        with ProcessPoolExecutor(workers, mp_context=worker_context()) as pool:
+            for record in records:
+                if task:
+                    task.check()
+                when = datetime.fromisoformat(record['date']) if record.get('date') else None
+                entry = self.new_entry(record['title'], record['content'], when=when)
+                for field in ('emotion', 'sentiment_score'):
+                    if record.get(field) is not None:
+                        entry[field] = record[field]
+                match = ENTRY_ID_RE.fullmatch(str(record.get('id') or ''))
+                if match:
+                    # An exact id is kept; a clash gets a new suffix rather than overwriting the existing entry.
+                    entry['id'] = record['id'] if record['id'] not in taken and self.store.get(user, record['id']) is None \
+                        else self.free_id(user, match.group(1), taken)
+                else:
+                    entry['id'] = self.free_id(user, entry['id'], taken)
+                taken.add(entry['id'])
+                entry['attachments'] = [path if self.attachments.is_blob(path) else self.attachments.put(path)
+                                        for path in record.get('attachments', [])]
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    write(pool)
+            if batch:
+                write(pool)
+        self.flush(user)
+        return imported
+
+    def import_audio(self, user, paths, engine, workers=None, task=None):
+        """Transcribe audio files into entries (titled after the file, dated by its mtime, with the recording attached).
+
+        Files that transcribe to nothing are skipped. Returns the number of entries imported.
+        """
+        def records():
+            for number, path in enumerate(paths):
+                if task:
+                    task.check()
+                    task.report(number, len(paths), f"Transcribing {os.path.basename(path)}")
+                content = transcribe_file(engine, path)
+                if content:
+                    yield {
+                        'title': os.path.splitext(os.path.basename(path))[0],
+                        'content': content,
+                        'date': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+                        'attachments': [path]
+                    }
+
+        return self.import_entries(user, records(), workers=workers)
+
+    def export_pdf(self, user, filename, start=None, end=None, emotions=None, volume_size=None, workers=None, task=None):
+        return export_pdf(self.store, user, filename, start, end, emotions, volume_size, workers, task)
+
+    def export_json(self, user, f):
+        """Write the user's entries to the file object ``f`` as JSON lines; returns the count."""
+        written = 0
+        for entry in self.store.iter_entries(user):
+            f.write(json.dumps(entry) + '\n')
+            written += 1
+        return written
+
+    # Housekeeping
+
+    def archive_entries(self, user, before):
+        """Compact the user's entries dated before ``before`` (YYYY-MM-DD) into the store's archive; returns how many moved."""
+        return self.store.compact(user, before)
+
+    def collect_attachments(self, grace_seconds=24 * 3600):
+        self.attachments.rebuild_refs(self.store)
+        return self.attachments.gc(grace_seconds)
+
+    def flush(self, user=None):
+        with self.lock:
+            derived = [obj for cache in (self._search_indexes, self._aggregates)
+                       for name, obj in cache.items() if user is None or name == user]
+        for obj in derived:
+            obj.flush()
+
+    def forget(self, user):
+        """Flush and drop the user's cached derived data (e.g. on logout)."""
+        self.flush(user)
+        with self.lock:
+            index = self._search_indexes.pop(user, None)
+            self._aggregates.pop(user, None)
+        if index:
+            index.close()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            indexes, self._search_indexes = list(self._search_indexes.values()), {}
+        for index in indexes:
+            index.close()
+        self.store.close()
+        self.attachments.close()
+        self.users.close()
@@ -0,0 +1,209 @@
+"""PDF export of diary entries.
+
+Entries are streamed from the store in date order and laid out with cached
+per-word widths. Large exports can be split into volumes that are rendered in
+parallel worker processes and, when ``pypdf`` is installed, merged into one file.
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from diarybot.lazy import available, lazy_import
+from diarybot.metrics import timed
+from diarybot.tasks import worker_context
+
+pagesizes = lazy_import('reportlab.lib.pagesizes')
+pdfmetrics = lazy_import('reportlab.pdfbase.pdfmetrics')
+canvas = lazy_import('reportlab.pdfgen.canvas')
+pypdf = lazy_import('pypdf')  # Optional: volumes are left as separate files without it
+
+BODY_FONT, BODY_SIZE = "Helvetica", 10
+MAX_LINE_WIDTH = 400  # Maximum width in points
+
+
+@lru_cache(maxsize=65536)
+def word_width(word, font=BODY_FONT, size=BODY_SIZE):
+    return pdfmetrics.stringWidth(word, font, size)
+
+
+def wrap_text(text, max_width=MAX_LINE_WIDTH, font=BODY_FONT, size=BODY_SIZE):
+    """Greedy word wrap; a line's width is the running sum of cached word widths."""
+    space = word_width(' ', font, size)
+    lines, current, current_width = [], [], 0.0
+    for word in text.split():
+        width = word_width(word, font, size)
+        new_width = current_width + space + width if current else width
+        if new_width <= max_width:
+            current.append(word)
+            current_width = new_width
+        elif current:
+            lines.append(' '.join(current))
+            current, current_width = [word], width
+        else:
+            # Single word is too long, give it its own line
+            lines.append(word)
+    if current:
+        lines.append(' '.join(current))
+    return lines
+
+
+def matches(entry, start=None, end=None, emotions=None):
+    """Date-range (inclusive ``YYYY-MM-DD`` strings) and emotion filter."""
+    day = entry['date'][:10]
+    if start and day < start:
+        return False
+    if end and day > end:
+        return False
+    return not emotions or entry.get('emotion') in emotions
+
+
+@timed('export.render')
+def render(entries, filename, heading, on_entry=None):
+    """Lay out ``entries`` into ``filename``; returns the number of entries written."""
+    c = canvas.Canvas(filename, pagesize=pagesizes.letter)
+    width, height = pagesizes.letter
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(100, height - 50, heading)
+    y_position = height - 100
+    written = 0
+    for entry in entries:
+        if on_entry:
+            on_entry(written)
+        if y_position < 150:
+            c.showPage()
+            y_position = height - 50
+        c.setFont("Helvetica-Bold", 12)
+        date_str = datetime.fromisoformat(entry['date']).strftime('%Y-%m-%d %H:%M')
+        c.drawString(100, y_position, f"{entry['title']} ({date_str})")
+        y_position -= 25
+        c.setFont("Helvetica", 9)
+        c.drawString(100, y_position, f"Emotion: {entry.get('emotion', 'N/A')} | Score: {entry.get('sentiment_score', 0):.2f}")
+        y_position -= 20
+        c.setFont(BODY_FONT, BODY_SIZE)
+        for line in wrap_text(entry['content']):
+            if y_position < 50:  # Check for page overflow
+                c.showPage()
+                c.setFont(BODY_FONT, BODY_SIZE)
+                y_position = height - 50
+            c.drawString(100, y_position, line)
+            y_position -= 15
+        if entry.get('attachments'):
+            y_position -= 10
+            c.setFont("Helvetica-Oblique", 9)
+            c.drawString(100, y_position, f"Attachments: {len(entry['attachments'])} file(s)")
+            y_position -= 15
+        y_position -= 10
+        if y_position > 50:
+            c.line(100, y_position, 500, y_position)
+            y_position -= 20
+        written += 1
+    c.save()
+    return written
+
+
+def render_volume(entries, filename, heading):
+    """Process-pool entry point for one volume."""
+    return render(entries, filename, heading)
+
+
+def _volumes(entries, size):
+    volume = []
+    for entry in entries:
+        volume.append(entry)
+        if len(volume) >= size:
+            yield volume
+            volume = []
+    if volume:
+        yield volume
+
+
+@timed('export.merge')
+def merge(parts, filename):
+    writer = pypdf.PdfWriter()
+    for part in parts:
+        writer.append(part)
+    with open(filename, 'wb') as f:
+        writer.write(f)
+    writer.close()
+    for part in parts:
+        os.remove(part)
+
+
+@timed('export.pdf')
+def export_pdf(store, user, filename, start=None, end=None, emotions=None, volume_size=None, workers=None, task=None):
+    """Export ``user``'s entries to ``filename`` and return the list of files written.
+
+    With ``volume_size`` set, every ``volume_size`` entries become a volume
+    rendered in a worker process; volumes are merged into ``filename`` if
+    ``pypdf`` is available and otherwise kept as ``<name>_volN.pdf`` files.
+    ``task`` (a ``diarybot.tasks.Task``) receives progress and may cancel.
+    """
+    if start or end or emotions:
+        # The filters only look at summary fields, so the matching entries can be counted without reading them.
+        total = sum(1 for summary in store.list_summaries(user) if matches(summary, start, end, emotions))
+    else:
+        total = store.count(user)
+    entries = (entry for entry in store.iter_entries(user) if matches(entry, start, end, emotions))
+    heading = f"Diary Export - {user}"
+
+    def on_entry(done):
+        if task:
+            task.check()
+            if done % 25 == 0:
+                task.report(done, total, f"Exporting entry {done + 1}")
+
+    def finished(written):
+        if task:
+            task.report(written, total, f"Exported {written} entries")
+
+    if not volume_size:
+        finished(render(entries, filename, heading, on_entry))
+        return [filename]
+
+    volumes = _volumes(entries, volume_size)
+    first, second = next(volumes, None), next(volumes, None)
+    if second is None:
+        # One volume: rendering it here is cheaper than starting worker processes.
+        finished(render(first or [], filename, heading, on_entry))
+        return [filename]
+
+    base, ext = os.path.splitext(filename)
+    parts, pending, done = [], [], 0
+    try:
+        with ProcessPoolExecutor(workers, mp_context=worker_context()) as pool:
+            max_in_flight = (workers or os.cpu_count() or 1) + 1
+            try:
+                for number, volume in enumerate(itertools.chain((first, second), volumes), 1):
+                    if task:
+                        task.check()
+                    part = f"{base}_vol{number}{ext}"
+                    parts.append(part)
+                    pending.append(pool.submit(render_volume, volume, part, f"{heading} (Volume {number})"))
+                    while len(pending) >= max_in_flight:
+                        done += pending.pop(0).result()
+                        if task:
+                            task.report(done, total, f"Exported {done} entries")
+                for future in pending:
+                    if task:
+                        task.check()
+                    done += future.result()
+                    if task:
+                        task.report(done, total, f"Exported {done} entries")
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        if not available(pypdf):
+            return parts
+        if task:
+            task.report(done, total, "Merging volumes")
+        merge(parts, filename)
+    except BaseException:
+        # Leaving the pool waits for running volumes, so no part is written after this.
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+        raise
+    return [filename]
@@ -0,0 +1,171 @@
+"""Persistent per-user summary index for the JSON-directory store.
+
+The index remembers, for every ``{user}_{id}.json`` file, its mtime/size and
+the fields the entry list needs (id, date, title, emotion, sentiment_score).
+It is trusted as long as the ``entries/`` directory mtime is unchanged; when
+files appear or disappear only new or modified files are parsed again.
+Entries compacted into the store's archive are merged into the date order
+unless a file of the same id replaces them.
+"""
+import json
+import os
+import threading
+
+from diarybot.metrics import count, span
+
+SUMMARY_FIELDS = ('id', 'date', 'title', 'emotion', 'sentiment_score')
+
+
+def summarize(entry):
+    return {field: entry.get(field) for field in SUMMARY_FIELDS}
+
+
+class EntryIndex:
+    def __init__(self, root, user, split_filename, archived=None):
+        self.root = root
+        self.user = user
+        self.split_filename = split_filename
+        self.archived = archived  # Returns the user's current ``UserArchive``
+        self.archived_version = None
+        self.path = os.path.join(root, '.index', f"{user}.json")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.RLock()
+        self.dir_mtime = None
+        self.files = {}
+        self.ordered = None
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.dir_mtime, self.files = data['dir_mtime'], data['files']
+        except (json.JSONDecodeError, FileNotFoundError, KeyError):
+            self.dir_mtime, self.files = None, {}
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'dir_mtime': self.dir_mtime, 'files': self.files}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def _dir_mtime(self):
+        return os.stat(self.root).st_mtime_ns
+
+    def refresh(self):
+        """Bring the index up to date, re-reading only new or changed files."""
+        with self.lock:
+            dir_mtime = self._dir_mtime()
+            if dir_mtime == self.dir_mtime:
+                return
+            with span('storage.index_scan'):
+                seen = set()
+                for filename in os.listdir(self.root):
+                    parsed = self.split_filename(filename)
+                    if not parsed or parsed[0] != self.user:
+                        continue
+                    seen.add(filename)
+                    try:
+                        st = os.stat(os.path.join(self.root, filename))
+                    except FileNotFoundError:
+                        continue
+                    record = self.files.get(filename)
+                    if record and record['mtime'] == st.st_mtime_ns and record['size'] == st.st_size:
+                        continue
+                    try:
+                        with open(os.path.join(self.root, filename), 'r') as f:
+                            entry = json.load(f)
+                    except (json.JSONDecodeError, FileNotFoundError):
+                        print(f"Skipping malformed JSON file: {filename}")
+                        count('storage.malformed_files')
+                        self.files.pop(filename, None)
+                        continue
+                    self.files[filename] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'summary': summarize(entry)}
+                    count('storage.files_parsed')
+                for filename in set(self.files) - seen:
+                    del self.files[filename]
+            self.dir_mtime = dir_mtime
+            self.ordered = None
+            self.dirty = True
+            self.flush()
+
+    def record(self, written, dir_mtime_before):
+        """Note ``(filename, entry)`` pairs the store just wrote; ``dir_mtime_before`` is the directory mtime prior to writing."""
+        with self.lock:
+            for filename, entry in written:
+                st = os.stat(os.path.join(self.root, filename))
+                self.files[filename] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'summary': summarize(entry)}
+            # Only skip the next scan if nothing else touched the directory since we last looked.
+            if self.dir_mtime == dir_mtime_before:
+                self.dir_mtime = self._dir_mtime()
+            self.ordered = None
+            self.dirty = True
+
+    def _ordered(self):
+        # Called with the lock held.
+        archive = self.archived() if self.archived else None
+        version = archive.version if archive else None
+        if self.ordered is None or version != self.archived_version:
+            summaries = [record['summary'] for record in self.files.values()]
+            if archive and archive.summaries:
+                live = {summary['id'] for summary in summaries}
+                summaries += [summary for summary in archive.summaries if summary['id'] not in live]
+            self.ordered = sorted(summaries, key=lambda x: x['date'])
+            self.archived_version = version
+        return self.ordered
+
+    def summaries(self, reverse=False, offset=0, limit=None):
+        """Return summaries ordered by date; ``offset``/``limit`` select one page of that order."""
+        self.refresh()
+        with self.lock:
+            ordered = self._ordered()
+        total = len(ordered)
+        end = total if limit is None else min(total, offset + limit)
+        if not reverse:
+            return ordered[offset:end]
+        return ordered[max(total - end, 0):max(total - offset, 0)][::-1]
+
+    def live_summaries(self):
+        """Summaries of the entries stored as files, in no particular order."""
+        self.refresh()
+        with self.lock:
+            return [record['summary'] for record in self.files.values()]
+
+    def count(self):
+        self.refresh()
+        with self.lock:
+            return len(self._ordered())
+
+    def versions(self, ids=None):
+        """Map entry ids (all, or just ``ids``) to a token that changes whenever the entry is rewritten.
+
+        A file's token is its mtime and size; an archived entry's is the mtime of its segment.
+        """
+        self.refresh()
+        archive = self.archived() if self.archived else None
+        with self.lock:
+            if ids is None:
+                found = {record['summary']['id']: f"{record['mtime']}:{record['size']}" for record in self.files.values()}
+            else:
+                records = ((entry_id, self.files.get(f"{self.user}_{entry_id}.json")) for entry_id in ids)
+                found = {entry_id: f"{record['mtime']}:{record['size']}" for entry_id, record in records if record}
+        if archive:
+            wanted = archive.rows if ids is None else [entry_id for entry_id in ids if entry_id in archive.rows]
+            for entry_id in wanted:
+                if entry_id not in found:
+                    found[entry_id] = f"archive:{archive.rows[entry_id][0].version}"
+        return found
+
+    def revision(self):
+        """A token that changes whenever any of the user's entries is written, archived or removed."""
+        # Entry files are only ever renamed into place or deleted, both of which move the directory mtime
+        # the index is already trusted by; it also moves for other users' saves, which costs a needless check.
+        self.refresh()
+        archive = self.archived() if self.archived else None
+        with self.lock:
+            return f"{self.dir_mtime}:{archive.version if archive else None}"
@@ -0,0 +1,137 @@
+"""Write-ahead journal for the JSON-directory store.
+
+Every ``save_many`` batch is appended to ``entries/.journal/entries.log`` as
+one checksummed line and fsynced before any entry file is touched; callers
+saving at the same time share one fsync (group commit). Entry files are then
+written to a temporary name and renamed into place without an fsync of their
+own. The journal is truncated at a checkpoint, once the files it covers have
+been flushed to disk; after a crash, ``records`` yields the batches that may
+not have reached their files so the store can re-apply them.
+"""
+import json
+import os
+import threading
+import zlib
+
+from diarybot.metrics import span, timed
+
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+
+def _encode(user, entries):
+    payload = json.dumps({'user': user, 'entries': entries}, separators=(',', ':')).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def _fsync_file(path):
+    """Flush a file to disk; False if that failed. Opened for writing, as Windows cannot flush a read-only handle."""
+    try:
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    except FileNotFoundError:
+        return True  # Replaced or deleted since; whoever did that owns its durability
+    except OSError:
+        return False
+    try:
+        os.fsync(fd)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(path):
+    # Windows cannot open a directory at all (and NTFS journals renames itself); elsewhere it is best effort.
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # Some platforms cannot fsync a directory
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, path, checkpoint_bytes=CHECKPOINT_BYTES):
+        self.path = path
+        self.checkpoint_bytes = checkpoint_bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0), 0o644)
+        self.lock = threading.Lock()  # Appends and checkpoint bookkeeping
+        self.sync_lock = threading.Lock()  # Held by the one thread fsyncing for everybody
+        self.appended = 0
+        self.synced = 0
+        self.in_flight = 0  # Batches journalled but not yet written to their files
+        self.unsynced = set()  # Entry files written since the last checkpoint
+
+    def records(self):
+        """Yield ``(user, entries)`` for every intact batch, stopping at a torn or corrupt line."""
+        with open(self.path, 'rb') as f:
+            for line in f:
+                checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+                if not line.endswith(b'\n') or checksum != b'%08x' % zlib.crc32(payload):
+                    break
+                record = json.loads(payload)
+                yield record['user'], record['entries']
+
+    def append(self, user, entries):
+        """Durably log a batch; returns once it (and any batch appended before it) is on disk."""
+        line = _encode(user, entries)
+        with self.lock:
+            os.write(self.fd, line)
+            self.appended += 1
+            self.in_flight += 1
+            seq = self.appended
+        try:
+            with self.sync_lock:
+                if self.synced < seq:
+                    with self.lock:
+                        target = self.appended
+                    with span('journal.fsync'):
+                        os.fsync(self.fd)
+                    self.synced = target
+        except BaseException:
+            # The caller will not write the batch, so it must not hold off checkpoints for good.
+            with self.lock:
+                self.in_flight -= 1
+            raise
+
+    def applied(self, paths):
+        """Report that a batch from ``append`` has been written (or has failed) to ``paths``."""
+        with self.lock:
+            self.in_flight -= 1
+            self.unsynced.update(paths)
+            due = self.in_flight == 0 and os.fstat(self.fd).st_size >= self.checkpoint_bytes
+        if due:
+            self.checkpoint()
+
+    @timed('journal.checkpoint')
+    def checkpoint(self, paths=()):
+        """Flush written entry files (plus ``paths``) to disk and empty the journal.
+
+        Returns False, keeping the journal, if batches are in flight or a file could not be flushed.
+        """
+        with self.lock:
+            if self.in_flight:
+                return False
+            self.unsynced.update(paths)
+            failed = [path for path in self.unsynced if not _fsync_file(path)]
+            if failed:
+                # The journal is the only durable copy of these; it stays until a later checkpoint succeeds.
+                print(f"Journal checkpoint postponed: could not flush {len(failed)} entry file(s), e.g. {failed[0]}")
+                return False
+            for directory in {os.path.dirname(path) for path in self.unsynced}:
+                _fsync_directory(directory)
+            os.ftruncate(self.fd, 0)
+            os.fsync(self.fd)
+            self.unsynced.clear()
+            return True
+
+    def close(self):
+        self.checkpoint()
+        os.close(self.fd)
@@ -0,0 +1,94 @@
+"""Deferred imports for the heavy libraries (matplotlib, TextBlob, ReportLab, NumPy, ...).
+
+``lazy_import(name)`` returns a stand-in that imports the real module on
+first attribute access, so the login window does not wait on code most
+sessions never touch. ``prewarm`` loads them on a background thread once the
+window is up, and ``timings`` records how long each load took for the
+startup report (``python dairyBot.py --startup-timing``).
+"""
+import importlib
+import threading
+import time
+
+timings = {}  # label -> (seconds, thread name), first load only
+_lock = threading.Lock()
+
+
+def _record(label, seconds):
+    with _lock:
+        timings.setdefault(label, (seconds, threading.current_thread().name))
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__.update(_name=name, _module=None, _error=None)
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            if self._error is not None:
+                raise self._error
+            started = time.perf_counter()
+            try:
+                module = importlib.import_module(self._name)
+            except ImportError as e:
+                self.__dict__['_error'] = e
+                raise
+            _record(self._name, time.perf_counter() - started)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def available(module):
+    """Whether an optional lazy module can be imported (imports it if so)."""
+    try:
+        module._load()
+    except ImportError:
+        return False
+    return True
+
+
+def prewarm(*targets, on_done=None):
+    """Load lazy modules and run warm-up callables on a daemon thread; returns the thread.
+
+    Missing optional modules are skipped. ``on_done`` is called on the
+    worker thread when everything has loaded.
+    """
+    def run():
+        for target in targets:
+            if isinstance(target, LazyModule):
+                available(target)
+                continue
+            started = time.perf_counter()
+            try:
+                target()
+            except Exception:  # Warming is best effort; the real call reports the error
+                continue
+            _record(f"{target.__module__}.{target.__qualname__}()", time.perf_counter() - started)
+        if on_done:
+            on_done()
+
+    thread = threading.Thread(target=run, name='diarybot-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+
+def report():
+    """Lines for the startup report, slowest first."""
+    with _lock:
+        items = sorted(timings.items(), key=lambda item: -item[1][0])
+    return [f"{seconds * 1000:8.1f} ms  {label}  [{thread}]" for label, (seconds, thread) in items]
@@ -0,0 +1,191 @@
+"""Lightweight in-process instrumentation: timing spans, counters and an optional profiler.
+
+Hot paths are wrapped with ``@timed('storage.save_many')`` or
+``with span('ui.show_main_app'):``; each operation keeps a count, a total and
+its most recent durations for percentiles. ``snapshot`` feeds the Settings
+tab's performance panel and ``to_json`` / ``to_prometheus`` dump the same
+numbers. While ``profiler`` is running, every outermost span is also captured
+with cProfile, whichever thread it runs on.
+
+Work done in worker processes (sentiment scoring, PDF volumes) is measured
+in the parent through the background task that waits for it.
+"""
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+
+SAMPLES_KEPT = 1024  # Per operation, for percentiles
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Operation:
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES_KEPT)
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Profiler:
+    """cProfile capture toggled at runtime; spans on any thread contribute while it runs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.stats = None
+        self.local = threading.local()
+
+    def start(self):
+        with self.lock:
+            self.running, self.stats = True, None
+
+    def stop(self):
+        """Stop capturing and return the collected ``pstats.Stats`` (None if no span ran)."""
+        with self.lock:
+            self.running = False
+            return self.stats
+
+    def _enter(self):
+        if not self.running or getattr(self.local, 'profile', None) is not None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Python 3.12+ allows one active profiler per process
+            return None
+        self.local.profile = profile
+        return profile
+
+    def _exit(self, profile):
+        profile.disable()
+        self.local.profile = None
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+
+def top_functions(stats, limit=20, sort='cumulative'):
+    """Text table of the costliest functions in a ``pstats.Stats``."""
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.counters = {}
+        self.enabled = True
+        self.profiler = Profiler()
+
+    def record(self, name, seconds):
+        with self.lock:
+            op = self.operations.get(name)
+            if op is None:
+                op = self.operations[name] = Operation()
+            op.count += 1
+            op.total += seconds
+            op.max = max(op.max, seconds)
+            op.samples.append(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def timed(self, name):
+        """Decorator form of ``span``."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Span(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self.lock:
+            self.operations.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """``{'operations': {name: {count, total, max, p50, p90, p99}}, 'counters': {...}}``, times in seconds."""
+        with self.lock:
+            operations = {name: (op.count, op.total, op.max, sorted(op.samples)) for name, op in self.operations.items()}
+            counters = dict(self.counters)
+        report = {}
+        for name, (count, total, longest, ordered) in sorted(operations.items()):
+            row = {'count': count, 'total': total, 'max': longest}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}"] = _quantile(ordered, q)
+            report[name] = row
+        return {'operations': report, 'counters': dict(sorted(counters.items()))}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The snapshot in Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = ['# HELP diarybot_operation_seconds Latency of instrumented DiaryBot operations.',
+                 '# TYPE diarybot_operation_seconds summary']
+        for name, row in snapshot['operations'].items():
+            for q in QUANTILES:
+                lines.append(f'diarybot_operation_seconds{{operation="{name}",quantile="{q}"}} {row[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'diarybot_operation_seconds_sum{{operation="{name}"}} {row["total"]:.6f}')
+            lines.append(f'diarybot_operation_seconds_count{{operation="{name}"}} {row["count"]}')
+        lines += ['# HELP diarybot_events_total Counted DiaryBot events.', '# TYPE diarybot_events_total counter']
+        for name, value in snapshot['counters'].items():
+            lines.append(f'diarybot_events_total{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write the snapshot to ``path``: Prometheus text for ``.prom``/``.txt``, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'started', 'profile')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.profile = self.registry.profiler._enter()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.registry.profiler._exit(self.profile)
+        if self.registry.enabled:
+            self.registry.record(self.name, elapsed)
+        return False
+
+
+metrics = Registry()
+span = metrics.span
+timed = metrics.timed
+count = metrics.count
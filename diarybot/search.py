@@ -0,0 +1,188 @@
+"""Per-user full-text index behind the Search tab.
+
+Query syntax: plain words must all match (ranked with BM25), ``word*`` matches
+any term starting with ``word``, ``"quoted words"`` must appear as a phrase,
+and ``emotion:positive``, ``after:2024-01-01`` and ``before:2024-12-31``
+filter on entry metadata.
+
+Each user's index is an SQLite FTS5 database (``.search/{user}.db``), so
+opening it costs nothing, a query reads only the postings of its own terms,
+and saving an entry writes just that entry's rows. Every document keeps the
+store's version of its entry, and the index the store revision it last
+matched, so entries rewritten elsewhere (crash recovery, another process)
+are re-indexed by ``sync``.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from diarybot.metrics import timed
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+FILTERS = ('emotion', 'after', 'before')
+RESULT_FIELDS = ('id', 'date', 'title', 'emotion', 'score')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        rowid INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        date TEXT NOT NULL,
+        title TEXT NOT NULL,
+        emotion TEXT,
+        version TEXT
+    );
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    CREATE VIRTUAL TABLE IF NOT EXISTS text USING fts5(
+        title, content, tokenize = "unicode61 remove_diacritics 0 tokenchars '_'"
+    );
+"""
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query):
+    """Split a query string into (terms, prefixes, phrases, filters)."""
+    terms, prefixes, phrases, filters = [], [], [], {}
+    for match in QUERY_RE.finditer(query):
+        phrase, word = match.groups()
+        if phrase is not None:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                phrases.append(tokens)
+            else:
+                terms.extend(tokens)
+            continue
+        key, sep, value = word.partition(':')
+        if sep and key.lower() in FILTERS and value:
+            filters[key.lower()] = value.lower()
+        elif word.endswith('*'):
+            tokens = tokenize(word[:-1])
+            terms.extend(tokens[:-1])
+            prefixes.extend(tokens[-1:])
+        else:
+            terms.extend(tokenize(word))
+    return terms, prefixes, phrases, filters
+
+
+def match_expression(terms, prefixes, phrases):
+    """An FTS5 MATCH expression requiring every term, prefix and phrase ('' if there are none)."""
+    # Tokens are \w+ runs, so quoting them is enough to keep FTS5 operators (AND, NEAR, ...) literal.
+    parts = [f'"{term}"' for term in terms] + [f'"{prefix}"*' for prefix in prefixes]
+    parts += ['"' + ' '.join(phrase) + '"' for phrase in phrases]
+    return ' AND '.join(parts)
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Tk callbacks and worker threads share one connection, serialised by the lock.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+            if 'version' not in {row[1] for row in self.conn.execute('PRAGMA table_info(docs)')}:
+                self.conn.execute('ALTER TABLE docs ADD COLUMN version TEXT')  # Unversioned documents are re-indexed once
+            self.conn.commit()
+
+    @classmethod
+    @timed('search.load')
+    def for_user(cls, store, user):
+        """Open the user's index and bring it in line with the store's entries."""
+        directory = os.path.join(store.data_dir, '.search')
+        legacy_path = os.path.join(directory, f"{user}.json")
+        if os.path.exists(legacy_path):  # The old single-document index; sync rebuilds its contents
+            os.remove(legacy_path)
+        index = cls(os.path.join(directory, f"{user}.db"))
+        index.sync(store, user)
+        return index
+
+    def flush(self):
+        # Every change is committed as it is made; kept for the derived-data interface.
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @timed('search.sync')
+    def sync(self, store, user):
+        """Re-index entries whose store version differs from the indexed one and drop vanished ones.
+
+        Cheap when the store's revision for the user is the one last synced.
+        """
+        revision = store.revision(user)  # Read first: a write after this leaves the next sync a new revision
+        with self.lock, self.conn:
+            if self.conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone() == (revision,):
+                return
+            indexed = dict(self.conn.execute('SELECT id, version FROM docs'))
+            versions = store.versions(user)
+            for doc_id in indexed.keys() - versions.keys():
+                self._remove(doc_id)
+            for doc_id, version in versions.items():
+                if indexed.get(doc_id) != version:
+                    entry = store.get(user, doc_id)
+                    if entry is not None:
+                        self._add(entry, version)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)", (revision,))
+
+    def _add(self, entry, version=None):
+        self._remove(entry['id'])
+        rowid = self.conn.execute('INSERT INTO docs (id, date, title, emotion, version) VALUES (?, ?, ?, ?, ?)',
+                                  (entry['id'], entry['date'], entry['title'], entry.get('emotion'), version)).lastrowid
+        # Title and content are separate columns, so phrases never span the two.
+        self.conn.execute('INSERT INTO text (rowid, title, content) VALUES (?, ?, ?)', (rowid, entry['title'], entry['content']))
+
+    def _remove(self, doc_id):
+        row = self.conn.execute('SELECT rowid FROM docs WHERE id = ?', (doc_id,)).fetchone()
+        if row:
+            self.conn.execute('DELETE FROM text WHERE rowid = ?', row)
+            self.conn.execute('DELETE FROM docs WHERE rowid = ?', row)
+
+    def add(self, entry, version=None):
+        """Index an entry just saved; ``version`` is the store's for it (see ``EntryStore.versions``)."""
+        with self.lock, self.conn:
+            self._add(entry, version)
+
+    def remove(self, doc_id):
+        with self.lock, self.conn:
+            self._remove(doc_id)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    @timed('search.query')
+    def search(self, query, limit=100):
+        """Return up to ``limit`` matching entry summaries, best match first."""
+        terms, prefixes, phrases, filters = parse_query(query)
+        conditions, params = [], []
+        if 'emotion' in filters:
+            conditions.append('docs.emotion = ?')
+            params.append(filters['emotion'])
+        if 'after' in filters:
+            conditions.append('substr(docs.date, 1, 10) >= ?')
+            params.append(filters['after'])
+        if 'before' in filters:
+            conditions.append('substr(docs.date, 1, 10) <= ?')
+            params.append(filters['before'])
+        expression = match_expression(terms, prefixes, phrases)
+        if expression:
+            # bm25() is lower for better matches (k1=1.2, b=0.75); results report it negated.
+            sql = ("SELECT docs.id, docs.date, docs.title, docs.emotion, -bm25(text) FROM text "
+                   "JOIN docs ON docs.rowid = text.rowid WHERE text MATCH ?"
+                   + ''.join(f" AND {condition}" for condition in conditions) + " ORDER BY bm25(text) LIMIT ?")
+            params.insert(0, expression)
+        else:
+            sql = ("SELECT docs.id, docs.date, docs.title, docs.emotion, 0.0 FROM docs"
+                   + (f" WHERE {' AND '.join(conditions)}" if conditions else '') + " ORDER BY docs.date DESC LIMIT ?")
+        with self.lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+        return [dict(zip(RESULT_FIELDS, row)) for row in rows]
@@ -0,0 +1,165 @@
+"""Sentiment scoring for diary entries, including bulk re-scoring of stored entries."""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from diarybot.lazy import lazy_import
+from diarybot.metrics import timed
+from diarybot.tasks import worker_context
+
+textblob = lazy_import('textblob')
+
+POSITIVE_THRESHOLD = 0.1
+NEGATIVE_THRESHOLD = -0.1
+
+
+def classify(polarity):
+    return "positive" if polarity > POSITIVE_THRESHOLD else "negative" if polarity < NEGATIVE_THRESHOLD else "neutral"
+
+
+@timed('sentiment.analyze')
+def analyze(content):
+    """Return ``(polarity, emotion)`` for a piece of text."""
+    polarity = textblob.TextBlob(content).sentiment.polarity
+    return polarity, classify(polarity)
+
+
+@timed('sentiment.score_batch')
+def score_batch(contents):
+    """Polarity for each text; runs in worker processes during a re-score."""
+    return [textblob.TextBlob(content).sentiment.polarity for content in contents]
+
+
+def warm_up():
+    """Import TextBlob and load its sentiment lexicon before the first real entry needs them."""
+    analyze("A good day.")
+
+
+@lru_cache(maxsize=None)
+def analyzer_version():
+    """Cached polarities are only reused while the analyzer producing them is unchanged."""
+    # Looked up on first use: scanning package metadata is slow enough to show at startup. The textblob
+    # module has no __version__, so a copy installed without metadata (e.g. vendored) counts as unversioned.
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return f"textblob-{version('textblob')}"
+    except PackageNotFoundError:
+        return "textblob-unknown"
+
+
+def content_key(content):
+    return hashlib.sha256(f"{analyzer_version()}\0{content}".encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    """Polarity by content hash + analyzer version, kept in a small SQLite file."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS polarity (key TEXT PRIMARY KEY, value REAL NOT NULL)')
+
+    @classmethod
+    def for_store(cls, store):
+        return cls(os.path.join(store.data_dir, '.cache', 'sentiment.db'))
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(f"SELECT key, value FROM polarity WHERE key IN ({', '.join('?' * len(chunk))})", chunk)
+                found.update(rows)
+        return found
+
+    def put_many(self, items):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO polarity (key, value) VALUES (?, ?)', items)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _batches(entries, size):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@timed('sentiment.rescore')
+def rescore(store, user, batch_size=256, workers=None, task=None, on_update=None):
+    """Re-run sentiment analysis over all of ``user``'s entries.
+
+    Entries are streamed from the store in batches; texts whose polarity is
+    already cached are not analysed again, the rest are scored in a process
+    pool. Entries whose score or emotion changed are written back with one
+    ``save_many`` per batch and passed to ``on_update``. ``task`` (a
+    ``diarybot.tasks.Task``) receives progress and may cancel the run.
+    """
+    stats = {'scanned': 0, 'cached': 0, 'scored': 0, 'updated': 0}
+    total = store.count(user)
+    cache = SentimentCache.for_store(store)
+    pending = deque()
+
+    def finish(batch, keys, known, missing_keys, future):
+        if future is not None:
+            scored = list(zip(missing_keys, future.result()))
+            cache.put_many(scored)
+            known.update(scored)
+            stats['scored'] += len(scored)
+        changed = []
+        for entry, key in zip(batch, keys):
+            polarity = known[key]
+            emotion = classify(polarity)
+            if entry.get('sentiment_score') != polarity or entry.get('emotion') != emotion:
+                changed.append(dict(entry, sentiment_score=polarity, emotion=emotion))
+        if changed:
+            store.save_many(user, changed)
+            if on_update:
+                on_update(changed)
+        stats['updated'] += len(changed)
+        stats['scanned'] += len(batch)
+        if task:
+            task.report(stats['scanned'], total, f"Re-scored {stats['scanned']} of {total} entries")
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=worker_context()) as pool:
+            max_in_flight = (workers or os.cpu_count() or 1) * 2
+            for batch in _batches(store.iter_entries(user), batch_size):
+                if task:
+                    task.check()
+                keys = [content_key(entry['content']) for entry in batch]
+                known = cache.get_many(set(keys))
+                stats['cached'] += sum(1 for key in keys if key in known)
+                missing = {}
+                for entry, key in zip(batch, keys):
+                    if key not in known:
+                        missing.setdefault(key, entry['content'])
+                future = pool.submit(score_batch, list(missing.values())) if missing else None
+                pending.append((batch, keys, known, list(missing), future))
+                if len(pending) >= max_in_flight:
+                    finish(*pending.popleft())
+            while pending:
+                if task:
+                    task.check()
+                finish(*pending.popleft())
+    finally:
+        for *_, future in pending:
+            if future is not None:
+                future.cancel()
+        cache.close()
+    return stats
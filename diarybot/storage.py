@@ -0,0 +1,412 @@
+"""Entry storage backends.
+
+Entries are plain dicts (id, title, content, date, emotion, sentiment_score,
+attachments). ``JsonDirStore`` keeps the original ``entries/{user}_{id}.json``
+layout, optionally with old entries compacted into an archive
+(``diarybot.archive``); ``SQLiteStore`` keeps everything in one indexed database.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from diarybot.archive import Archive, archivable
+from diarybot.index import SUMMARY_FIELDS, EntryIndex, summarize
+from diarybot.journal import Journal
+from diarybot.metrics import count, timed
+
+STALE_TMP_SECONDS = 3600  # Older temporary files are leftovers of a crashed save, not one in progress
+ENTRY_FIELDS = ('id', 'title', 'content', 'date', 'emotion', 'sentiment_score', 'attachments')
+
+
+def split_entry_filename(filename):
+    """Return (user, entry_id) for an ``{user}_{YYYYmmdd}_{HHMMSS}.json`` name, or None."""
+    if not filename.endswith('.json'):
+        return None
+    parts = filename[:-5].rsplit('_', 2)
+    if len(parts) != 3 or not parts[0]:
+        return None
+    return parts[0], f"{parts[1]}_{parts[2]}"
+
+
+class EntryStore:
+    """Interface shared by all entry backends."""
+
+    # Directory where derived data (search index, caches) for this store is kept.
+    data_dir = '.'
+
+    def save(self, user, entry):
+        self.save_many(user, [entry])
+
+    def save_many(self, user, entries):
+        raise NotImplementedError
+
+    def get(self, user, entry_id):
+        raise NotImplementedError
+
+    def iter_entries(self, user, reverse=False):
+        """Yield the user's entries ordered by date (newest first if ``reverse``)."""
+        raise NotImplementedError
+
+    def list_summaries(self, user, reverse=False, offset=0, limit=None):
+        """Return lightweight ``SUMMARY_FIELDS`` dicts for the user's entries, ordered by date.
+
+        ``offset`` and ``limit`` select a single page of that ordering.
+        """
+        rows = [summarize(entry) for entry in self.iter_entries(user, reverse)]
+        return rows[offset:None if limit is None else offset + limit]
+
+    def count(self, user):
+        return sum(1 for _ in self.iter_entries(user))
+
+    def versions(self, user, ids=None):
+        """Map the user's entry ids (all, or just ``ids``) to tokens that change whenever an entry is rewritten.
+
+        Derived data (search index, analytics) compares these to find entries
+        changed behind its back, e.g. by crash recovery or another process.
+        """
+        entries = self.iter_entries(user) if ids is None else filter(None, (self.get(user, entry_id) for entry_id in ids))
+        return {entry['id']: hashlib.sha1(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest() for entry in entries}
+
+    def revision(self, user):
+        """A token that changes whenever any of the user's entries does."""
+        return hashlib.sha1(json.dumps(sorted(self.versions(user).items())).encode('utf-8')).hexdigest()
+
+    def compact(self, user, before):
+        """Move the user's entries dated before ``before`` (ISO date) into compact storage; returns how many moved."""
+        return 0  # Nothing to do for backends that are already compact
+
+    def users(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonDirStore(EntryStore):
+    """One pretty-printed JSON file per entry, as DiaryBot has always stored them.
+
+    Writes go through a write-ahead journal (``diarybot.journal``) and each
+    file is replaced atomically, so a crash never leaves a truncated entry.
+    ``compact`` moves old entries into monthly archive segments; a file saved
+    later for an archived id (an edit or re-score) takes precedence over it.
+    """
+
+    def __init__(self, root='entries'):
+        self.root = self.data_dir = root
+        os.makedirs(root, exist_ok=True)
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Held only to rename an entry file into place or unlink it
+        self.compact_lock = threading.Lock()  # One compaction at a time; saves never wait for it
+        self.archive = Archive(os.path.join(root, '.archive'))
+        self.journal = Journal(os.path.join(root, '.journal', 'entries.log'))
+        self.recover()
+
+    def index(self, user):
+        with self._indexes_lock:
+            if user not in self._indexes:
+                self._indexes[user] = EntryIndex(self.root, user, split_entry_filename, lambda: self.archive.open(user))
+            return self._indexes[user]
+
+    def path_for(self, user, entry_id):
+        return os.path.join(self.root, f"{user}_{entry_id}.json")
+
+    def _write(self, user, entry):
+        path = self.path_for(user, entry['id'])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f, indent=2)
+            with self.write_lock:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    @timed('storage.save_many')
+    def save_many(self, user, entries):
+        if not entries:
+            return
+        index = self.index(user)
+        self.journal.append(user, entries)
+        count('storage.entries_written', len(entries))
+        dir_mtime_before = os.stat(self.root).st_mtime_ns
+        written = []
+        try:
+            for entry in entries:
+                written.append((os.path.basename(self._write(user, entry)), entry))
+        finally:
+            self.journal.applied([os.path.join(self.root, filename) for filename, _ in written])
+        index.record(written, dir_mtime_before)
+
+    @timed('storage.recover')
+    def recover(self):
+        """Re-apply journalled batches an interrupted run may not have finished; returns the entries rewritten."""
+        latest = {}
+        for user, entries in self.journal.records():
+            for entry in entries:
+                latest[user, entry['id']] = entry
+        paths = []
+        if latest:
+            self._remove_temp_files({f"{user}_{entry_id}.json" for user, entry_id in latest})
+            paths = [self._write(user, entry) for (user, entry_id), entry in latest.items() if self.get(user, entry_id) != entry]
+        # Also drops a torn final line, which would otherwise hide batches appended after it.
+        self.journal.checkpoint(paths)
+        return len(paths)
+
+    def _remove_temp_files(self, replayed):
+        # Another process sharing the directory may be saving right now, so its temporary files are left alone.
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for filename in os.listdir(self.root):
+            if not filename.endswith('.tmp'):
+                continue
+            path = os.path.join(self.root, filename)
+            try:
+                if filename.rsplit('.', 2)[0] in replayed or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self, user, entry_id):
+        try:
+            with open(self.path_for(user, entry_id), 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None
+
+    @timed('storage.get')
+    def get(self, user, entry_id):
+        entry = self._read(user, entry_id)
+        if entry is None:
+            entry = self.archive.open(user).get(entry_id)
+        return entry
+
+    def iter_entries(self, user, reverse=False):
+        # The index gives the date order, so entries can be streamed one file (or archive block) at a time.
+        index, archive = self.index(user), self.archive.open(user)
+        live = {summary['id'] for summary in index.live_summaries()} if archive.rows else ()
+        for summary in index.summaries(reverse):
+            entry_id = summary['id']
+            entry = archive.get(entry_id) if entry_id in archive.rows and entry_id not in live else self.get(user, entry_id)
+            if entry is not None:
+                yield entry
+
+    @timed('storage.list_summaries')
+    def list_summaries(self, user, reverse=False, offset=0, limit=None):
+        return self.index(user).summaries(reverse, offset, limit)
+
+    @timed('storage.count')
+    def count(self, user):
+        return self.index(user).count()
+
+    def versions(self, user, ids=None):
+        return self.index(user).versions(ids)
+
+    def revision(self, user):
+        return self.index(user).revision()
+
+    @timed('storage.compact')
+    def compact(self, user, before):
+        """Move entries dated before ``before`` into the user's monthly archive segments; returns how many moved.
+
+        Entries a segment could not reproduce exactly (e.g. dates with a time zone) stay as files.
+        """
+        index = self.index(user)
+        months = {}
+        for summary in index.live_summaries():
+            if summary['date'] and summary['date'] < before:
+                months.setdefault(summary['date'][:7], []).append(summary['id'])
+        moved = 0
+        with self.compact_lock:
+            for month, ids in sorted(months.items()):
+                read = []
+                for entry_id in ids:
+                    try:
+                        st = os.stat(self.path_for(user, entry_id))
+                    except FileNotFoundError:
+                        continue
+                    entry = self._read(user, entry_id)
+                    if entry is not None and archivable(entry) and entry['date'][:7] == month:
+                        read.append((entry, (st.st_ino, st.st_mtime_ns, st.st_size)))
+                if not read:
+                    continue
+                # Rows already archived for the month are kept unless a file replaces them.
+                merged = {entry['id']: entry for entry in self.archive.month(user, month)}
+                merged.update((entry['id'], entry) for entry, _ in read)
+                self.archive.write(user, month, sorted(merged.values(), key=lambda x: x['date']))
+                for entry, version in read:
+                    moved += self._unlink_if_unchanged(self.path_for(user, entry['id']), version)
+        count('storage.entries_archived', moved)
+        return moved
+
+    def _unlink_if_unchanged(self, path, version):
+        # A file saved again since it was archived is newer than the archived copy, so it stays and takes precedence.
+        with self.write_lock:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return False
+            if (st.st_ino, st.st_mtime_ns, st.st_size) != version:
+                return False
+            os.remove(path)
+            return True
+
+    def users(self):
+        found = set(self.archive.users())
+        for filename in os.listdir(self.root):
+            parsed = split_entry_filename(filename)
+            if parsed:
+                found.add(parsed[0])
+        return sorted(found)
+
+    def close(self):
+        with self._indexes_lock:
+            for index in self._indexes.values():
+                index.flush()
+        self.journal.close()
+        self.archive.close()
+
+
+class SQLiteStore(EntryStore):
+    """All users' entries in one SQLite database, indexed by user and date."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            user TEXT NOT NULL,
+            id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            emotion TEXT,
+            sentiment_score REAL,
+            attachments TEXT NOT NULL DEFAULT '[]',
+            revision INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user, id)
+        );
+        CREATE INDEX IF NOT EXISTS entries_user_date ON entries (user, date);
+    """
+
+    def __init__(self, path='diary.db'):
+        self.path = path
+        self.data_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Tk callbacks and worker threads share one connection, serialised by the lock.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(self.SCHEMA)
+            # Databases from before entry revisions were tracked get the column; their rows start at 0.
+            if 'revision' not in {row[1] for row in self.conn.execute('PRAGMA table_info(entries)')}:
+                self.conn.execute('ALTER TABLE entries ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS entries_user_revision ON entries (user, revision)')
+            self.conn.commit()
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry = dict(zip(ENTRY_FIELDS, row))
+        entry['attachments'] = json.loads(entry['attachments'])
+        return entry
+
+    @timed('storage.save_many')
+    def save_many(self, user, entries):
+        count('storage.entries_written', len(entries))
+        rows = [(user, e['id'], e['date'], e['title'], e['content'], e.get('emotion'),
+                 e.get('sentiment_score'), json.dumps(e.get('attachments', [])), user) for e in entries]
+        # Every write takes the user's next revision, computed inside the insert so concurrent writers cannot share one.
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO entries (user, id, date, title, content, emotion, sentiment_score, attachments, revision) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM entries WHERE user = ?))', rows)
+
+    def _select(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @timed('storage.get')
+    def get(self, user, entry_id):
+        rows = self._select(f"SELECT {', '.join(ENTRY_FIELDS)} FROM entries WHERE user = ? AND id = ?", (user, entry_id))
+        return self._row_to_entry(rows[0]) if rows else None
+
+    def iter_entries(self, user, reverse=False):
+        # A private read connection lets long scans (export, re-scoring) stream rows
+        # without holding the writer lock; WAL keeps it a consistent snapshot.
+        order = 'DESC' if reverse else 'ASC'
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(ENTRY_FIELDS)} FROM entries WHERE user = ? ORDER BY date {order}", (user,))
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_entry(row)
+        finally:
+            conn.close()
+
+    @timed('storage.list_summaries')
+    def list_summaries(self, user, reverse=False, offset=0, limit=None):
+        order = 'DESC' if reverse else 'ASC'
+        rows = self._select(f"SELECT {', '.join(SUMMARY_FIELDS)} FROM entries WHERE user = ? ORDER BY date {order} "
+                            "LIMIT ? OFFSET ?", (user, -1 if limit is None else limit, offset))
+        return [dict(zip(SUMMARY_FIELDS, row)) for row in rows]
+
+    @timed('storage.count')
+    def count(self, user):
+        return self._select('SELECT COUNT(*) FROM entries WHERE user = ?', (user,))[0][0]
+
+    def versions(self, user, ids=None):
+        if ids is None:
+            rows = self._select('SELECT id, revision FROM entries WHERE user = ?', (user,))
+        else:
+            ids, rows = list(ids), []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows += self._select(f"SELECT id, revision FROM entries WHERE user = ? AND id IN ({', '.join('?' * len(chunk))})",
+                                     [user] + chunk)
+        return {entry_id: str(revision) for entry_id, revision in rows}
+
+    def revision(self, user):
+        # Revisions only grow and there are no deletes, so the newest one changes with every write.
+        return str(self._select('SELECT MAX(revision) FROM entries WHERE user = ?', (user,))[0][0])
+
+    def users(self):
+        return [row[0] for row in self._select('SELECT DISTINCT user FROM entries ORDER BY user', ())]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def open_store(spec=None):
+    """Open a store from a ``json:<dir>`` or ``sqlite:<file>`` spec (default: $DIARYBOT_STORE or json:entries)."""
+    spec = spec or os.environ.get('DIARYBOT_STORE', 'json:entries')
+    kind, _, location = spec.partition(':')
+    if kind == 'json':
+        return JsonDirStore(location or 'entries')
+    if kind == 'sqlite':
+        return SQLiteStore(location or 'diary.db')
+    raise ValueError(f"Unknown entry store: {spec}")
+
+
+def migrate(source, target, users=None, batch_size=500):
+    """Copy every entry from ``source`` into ``target``; returns the number copied."""
+    copied = 0
+    for user in users or source.users():
+        batch = []
+        for entry in source.iter_entries(user):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                target.save_many(user, batch)
+                copied += len(batch)
+                batch = []
+        if batch:
+            target.save_many(user, batch)
+            copied += len(batch)
+    return copied
@@ -0,0 +1,210 @@
+"""Background task runner for the Tk app.
+
+Work is submitted to a thread pool (disk I/O, index scans, PDF writing) or a
+process pool (CPU-heavy NLP). Callbacks always run on the Tk thread: worker
+events are queued and drained from ``root.after``.
+"""
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+
+from diarybot.metrics import metrics
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, runner, label, on_done, on_error, on_progress, on_emit=None, on_cancel=None, cancellable=False,
+                 persistent=False):
+        self.runner = runner
+        self.label = label
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_emit = on_emit
+        self.on_cancel = on_cancel
+        self.cancellable = cancellable
+        self.persistent = persistent
+        self.detached = False  # Set by ``detach_all``: the task finishes but none of its callbacks run
+        self.metric = None
+        self.started = time.perf_counter()
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.progress = (0, None, '')
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        if not self.cancellable:
+            return
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Raise ``Cancelled`` if the task was cancelled; call this between units of work."""
+        if self.cancel_event.is_set():
+            raise Cancelled()
+
+    def report(self, done, total=None, message=''):
+        """Report progress from the worker; delivered to ``on_progress`` on the Tk thread."""
+        self.runner.events.put(('progress', self, (done, total, message)))
+
+    def emit(self, value):
+        """Hand a partial result (e.g. transcribed text) to ``on_emit`` on the Tk thread."""
+        self.runner.events.put(('emit', self, value))
+
+
+def worker_context():
+    """A multiprocessing context that never forks the calling process: forkserver where available, else spawn."""
+    # Forking a process that already runs Tk and pool threads can copy held locks into the child.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class TaskRunner:
+    def __init__(self, root, io_workers=4, cpu_workers=2, poll_ms=50, cpu_initializer=None, mp_context=None):
+        self.root = root
+        self.io_pool = ThreadPoolExecutor(io_workers, thread_name_prefix='diarybot-io')
+        self.cpu_workers = cpu_workers  # Each warm TextBlob worker holds ~50 MiB; the app needs one or two
+        self.cpu_initializer = cpu_initializer  # Run once in each worker process, e.g. to import TextBlob
+        self.mp_context = mp_context
+        self.cpu_pool = None
+        self.poll_ms = poll_ms
+        self.events = queue.Queue()
+        self.active = []
+        self.polling = False
+        self.on_change = None  # Called with the runner whenever tasks start, finish or report progress
+
+    def _cpu_pool(self):
+        if self.cpu_workers == 0:
+            return self.io_pool
+        if self.cpu_pool is None:
+            self.cpu_pool = ProcessPoolExecutor(self.cpu_workers, mp_context=self.mp_context or worker_context(),
+                                                initializer=self.cpu_initializer)
+        return self.cpu_pool
+
+    def start_cpu_pool(self):
+        """Start the worker processes now rather than on the first ``cpu`` task."""
+        pool = self._cpu_pool()
+        if pool is not self.io_pool:
+            pool.submit(int)
+
+    def submit(self, fn, *args, kind='io', label='Working', on_done=None, on_error=None, on_progress=None, on_emit=None,
+               on_cancel=None, cancellable=False, persistent=False):
+        """Run ``fn`` in the background and return its ``Task``.
+
+        ``io`` tasks are called as ``fn(task, *args)`` so they can report progress
+        and check for cancellation; ``cpu`` tasks run as ``fn(*args)`` in a
+        worker process, so ``fn`` and its arguments must be picklable.
+
+        Only ``cancellable`` tasks (ones that call ``task.check``) can be
+        cancelled; others always run to completion and deliver their result.
+        A cancelled task calls ``on_cancel`` instead of ``on_done``/``on_error``.
+        ``persistent`` tasks keep their callbacks through ``detach_all``.
+        """
+        task = Task(self, label, on_done, on_error, on_progress, on_emit, on_cancel, cancellable, persistent)
+        # Timed from submission to completion under the function's name; labels can hold file names.
+        task.metric = f"task.{getattr(fn, '__name__', 'anonymous').lstrip('_')}"
+        if kind == 'cpu':
+            task.future = self._cpu_pool().submit(fn, *args)
+        else:
+            task.future = self.io_pool.submit(self._run_io, fn, task, args)
+        task.future.add_done_callback(lambda future: self.events.put(('finished', task, future)))
+        self.active.append(task)
+        self._changed()
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return task
+
+    @staticmethod
+    def _run_io(fn, task, args):
+        task.check()
+        return fn(task, *args)
+
+    def cancel_all(self):
+        for task in list(self.active):
+            task.cancel()
+
+    def detach_all(self):
+        """Cancel running tasks and drop their callbacks, e.g. when the screens they would update go away."""
+        for task in list(self.active):
+            if not task.persistent:
+                task.cancel()
+                task.detached = True
+
+    def can_cancel(self):
+        return any(task.cancellable for task in self.active)
+
+    def _changed(self):
+        if self.on_change:
+            self._call(None, self.on_change, self)
+
+    @staticmethod
+    def _call(task, callback, *args):
+        # A failing callback is reported and skipped; it must not stop the delivery of every later event.
+        if callback is None or (task is not None and task.detached):
+            return
+        try:
+            callback(*args)
+        except Exception:
+            print(f"Callback for background task '{task.label if task else 'runner'}' failed:", file=sys.stderr)
+            traceback.print_exc()
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    kind, task, payload = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'progress':
+                    task.progress = payload
+                    if not task.cancelled:
+                        self._call(task, task.on_progress, *payload)
+                elif kind == 'emit':
+                    if not task.cancelled:
+                        self._call(task, task.on_emit, payload)
+                else:
+                    if task in self.active:
+                        self.active.remove(task)
+                    self._deliver(task, payload)
+                self._changed()
+        finally:
+            if self.active or not self.events.empty():
+                self.root.after(self.poll_ms, self._poll)
+            else:
+                self.polling = False
+
+    def _deliver(self, task, future):
+        metrics.record(task.metric, time.perf_counter() - task.started)
+        if task.cancelled:
+            # Whatever the work got done is discarded, but callers still get to restore their UI.
+            self._call(task, task.on_cancel)
+            return
+        try:
+            result = future.result()
+        except (Cancelled, CancelledError):
+            self._call(task, task.on_cancel)
+            return
+        except Exception as e:
+            if task.on_error is None and not task.detached:
+                print(f"Background task '{task.label}' failed: {e}")
+            self._call(task, task.on_error, e)
+            return
+        self._call(task, task.on_done, result)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(wait=False, cancel_futures=True)
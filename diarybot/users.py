@@ -0,0 +1,182 @@
+"""User accounts and sign-in sessions, kept in ``users/users.db``.
+
+Passwords are bcrypt hashes at a configurable cost (``DIARYBOT_BCRYPT_ROUNDS``);
+hashes made at another cost are upgraded the next time the password is
+verified. A successful login can leave a session token on disk so the app
+reopens signed in for ``DIARYBOT_SESSION_HOURS`` without paying the hash cost
+again. Accounts from the old one-file-per-user layout (``users/{name}.json``)
+are imported on first open.
+"""
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import bcrypt
+
+from diarybot.metrics import timed
+
+DEFAULT_ROUNDS = 12
+DEFAULT_SESSION_HOURS = 24 * 7
+
+
+class AuthError(Exception):
+    """Registration or login failed; the message is suitable for showing to the user."""
+
+
+def hash_rounds(password_hash):
+    """The cost factor a bcrypt hash was made with (``$2b$12$...`` -> 12)."""
+    return int(password_hash.split('$')[2])
+
+
+def _token_key(token):
+    # Only a digest is stored, so the database alone cannot be used to resume a session.
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class UserStore:
+    def __init__(self, root='users', rounds=None, session_hours=None):
+        self.root = root
+        self.rounds = rounds or int(os.environ.get('DIARYBOT_BCRYPT_ROUNDS', DEFAULT_ROUNDS))
+        if session_hours is None:
+            session_hours = float(os.environ.get('DIARYBOT_SESSION_HOURS', DEFAULT_SESSION_HOURS))
+        self.session_seconds = session_hours * 3600
+        self.session_file = os.path.join(root, 'session.json')
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'users.db'), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL, '
+                              'created_date TEXT NOT NULL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, username TEXT NOT NULL, '
+                              'expires REAL NOT NULL)')
+        self._import_json_users()
+
+    def _import_json_users(self):
+        """Move accounts from ``{name}.json`` files into the database, keeping the files as ``.json.migrated``."""
+        for name in os.listdir(self.root):
+            if not name.endswith('.json') or name == os.path.basename(self.session_file):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                row = (data['username'], data['password'], data.get('created_date') or datetime.now().isoformat())
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+            with self.lock, self.conn:
+                self.conn.execute('INSERT OR IGNORE INTO users (username, password, created_date) VALUES (?, ?, ?)', row)
+            os.replace(path, f"{path}.migrated")
+
+    @timed('users.bcrypt_hash')
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def _password_hash(self, username):
+        with self.lock:
+            row = self.conn.execute('SELECT password FROM users WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def exists(self, username):
+        return self._password_hash(username) is not None
+
+    def usernames(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT username FROM users ORDER BY username')]
+
+    @timed('users.register')
+    def register(self, username, password):
+        if not username or not password:
+            raise AuthError("Please fill in all fields.")
+        if self.exists(username):
+            raise AuthError("Username already exists.")
+        password_hash = self._hash(password)  # Slow on purpose; done outside the lock
+        with self.lock, self.conn:
+            inserted = self.conn.execute('INSERT OR IGNORE INTO users (username, password, created_date) VALUES (?, ?, ?)',
+                                         (username, password_hash, datetime.now().isoformat())).rowcount
+        if not inserted:
+            raise AuthError("Username already exists.")
+
+    @timed('users.authenticate')
+    def authenticate(self, username, password):
+        """Verify the password, re-hashing it if it was stored at another cost factor."""
+        if not username or not password:
+            raise AuthError("Please fill in all fields.")
+        password_hash = self._password_hash(username)
+        if password_hash is None:
+            raise AuthError("User not found.")
+        if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+            raise AuthError("Wrong password.")
+        if hash_rounds(password_hash) != self.rounds:
+            upgraded = self._hash(password)
+            with self.lock, self.conn:
+                self.conn.execute('UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                                  (upgraded, username, password_hash))
+
+    # Sessions
+
+    def create_session(self, username):
+        """Start a session and return its token (``None`` when sessions are disabled)."""
+        if self.session_seconds <= 0:
+            return None
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM sessions WHERE expires < ?', (now,))
+            self.conn.execute('INSERT INTO sessions (token, username, expires) VALUES (?, ?, ?)',
+                              (_token_key(token), username, now + self.session_seconds))
+        return token
+
+    def session_user(self, token):
+        """The username a live session token belongs to, or ``None``."""
+        with self.lock:
+            row = self.conn.execute('SELECT username, expires FROM sessions WHERE token = ?', (_token_key(token),)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def end_session(self, token):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM sessions WHERE token = ?', (_token_key(token),))
+
+    def remember(self, username):
+        """Start a session and keep its token in ``session.json`` for the next app start."""
+        token = self.create_session(username)
+        if token is None:
+            return
+        tmp_path = f"{self.session_file}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'username': username, 'token': token}, f)
+        os.replace(tmp_path, self.session_file)
+
+    def resume(self):
+        """The user signed in by the remembered session, or ``None`` if there is none or it expired."""
+        try:
+            with open(self.session_file, 'r') as f:
+                data = json.load(f)
+            username = self.session_user(data['token'])
+        except (json.JSONDecodeError, FileNotFoundError, KeyError, TypeError):
+            return None
+        if username is None or username != data.get('username'):
+            self.forget()
+            return None
+        return username
+
+    def forget(self):
+        """End the remembered session (on logout)."""
+        try:
+            with open(self.session_file, 'r') as f:
+                token = json.load(f).get('token')
+            os.remove(self.session_file)
+        except (json.JSONDecodeError, FileNotFoundError, AttributeError):
+            return
+        if token:
+            self.end_session(token)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,254 @@
+"""Chunked speech-to-text for dictation and for turning audio files into entries.
+
+Audio is handled as 16 kHz, 16-bit mono PCM. A ``Dictation`` records the
+microphone in short chunks on one thread and feeds them to a transcription
+engine on another, handing each recognised piece of text to a callback as soon
+as the engine settles on it. Engines are pluggable and chosen by a spec
+(``DIARYBOT_VOICE_ENGINE``):
+
+    vosk:<model dir>   offline, streaming (pip install vosk)
+    whisper[:<size>]   offline, in windows of a few seconds (pip install faster-whisper)
+    google             Google Web Speech via SpeechRecognition; needs network
+    fake[:<text>]      emits the given words one per chunk; for tests and demos
+"""
+import json
+import os
+import queue
+import threading
+
+from diarybot.lazy import lazy_import
+
+sr = lazy_import('speech_recognition')
+np = lazy_import('numpy')
+vosk = lazy_import('vosk')
+faster_whisper = lazy_import('faster_whisper')
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHUNK_SECONDS = 0.5
+AUDIO_EXTENSIONS = ('.wav', '.aif', '.aiff', '.aifc', '.flac')
+
+
+class VoiceError(Exception):
+    """Transcription could not run; the message is suitable for showing to the user."""
+
+
+class Session:
+    """One utterance being transcribed: ``accept`` PCM chunks, then ``finish``; both return settled text."""
+
+    def accept(self, pcm):
+        return ''
+
+    def finish(self):
+        return ''
+
+
+class BufferedSession(Session):
+    """For engines that work on whole clips: transcribe every ``window_seconds`` of audio."""
+
+    def __init__(self, transcribe, window_seconds):
+        self.transcribe = transcribe
+        self.window_bytes = int(window_seconds * SAMPLE_RATE) * SAMPLE_WIDTH
+        self.buffer = bytearray()
+
+    def accept(self, pcm):
+        self.buffer += pcm
+        if len(self.buffer) < self.window_bytes:
+            return ''
+        return self.finish()
+
+    def finish(self):
+        pcm, self.buffer = bytes(self.buffer), bytearray()
+        return self.transcribe(pcm).strip() if pcm else ''
+
+
+class FakeEngine:
+    def __init__(self, text="this is a test transcription"):
+        self.words = text.split()
+
+    def start(self):
+        return FakeSession(self.words)
+
+
+class FakeSession(Session):
+    def __init__(self, words):
+        self.words = list(words)
+        self.heard = False
+
+    def accept(self, pcm):
+        self.heard = True
+        return self.words.pop(0) if self.words else ''
+
+    def finish(self):
+        # Silence (no audio at all) transcribes to nothing, as with a real engine.
+        rest, self.words = ' '.join(self.words) if self.heard else '', []
+        return rest
+
+
+class VoskEngine:
+    def __init__(self, model_path):
+        if not os.path.isdir(model_path):
+            raise VoiceError(f"Vosk model not found: {model_path}")
+        self.model_path = model_path
+        self.model = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.model is None:  # Loading a model takes seconds; keep it for later sessions
+                self.model = vosk.Model(self.model_path)
+        return VoskSession(vosk.KaldiRecognizer(self.model, SAMPLE_RATE))
+
+
+class VoskSession(Session):
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            return json.loads(self.recognizer.Result()).get('text', '')
+        return ''
+
+    def finish(self):
+        return json.loads(self.recognizer.FinalResult()).get('text', '')
+
+
+class WhisperEngine:
+    def __init__(self, model_size='base', window_seconds=8):
+        self.model_size = model_size
+        self.window_seconds = window_seconds
+        self.model = None
+        self.lock = threading.Lock()
+
+    def _transcribe(self, pcm):
+        with self.lock:
+            if self.model is None:
+                self.model = faster_whisper.WhisperModel(self.model_size, device='cpu', compute_type='int8')
+            samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+            segments, _ = self.model.transcribe(samples, language='en', vad_filter=True)
+            return ' '.join(segment.text.strip() for segment in segments)
+
+    def start(self):
+        return BufferedSession(self._transcribe, self.window_seconds)
+
+
+class GoogleEngine:
+    def __init__(self, window_seconds=5):
+        self.window_seconds = window_seconds
+        self.recognizer = None
+
+    def _transcribe(self, pcm):
+        if self.recognizer is None:
+            self.recognizer = sr.Recognizer()
+        try:
+            return self.recognizer.recognize_google(sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH))
+        except sr.UnknownValueError:
+            return ''
+        except sr.RequestError as e:
+            raise VoiceError(f"Could not request results; check your internet connection: {e}")
+
+    def start(self):
+        return BufferedSession(self._transcribe, self.window_seconds)
+
+
+def open_engine(spec=None):
+    """Create an engine from a spec such as ``vosk:models/vosk-en`` (default: $DIARYBOT_VOICE_ENGINE or google)."""
+    spec = spec or os.environ.get('DIARYBOT_VOICE_ENGINE', 'google')
+    kind, _, option = spec.partition(':')
+    if kind == 'vosk':
+        return VoskEngine(option or 'vosk-model')
+    if kind == 'whisper':
+        return WhisperEngine(option or 'base')
+    if kind == 'google':
+        return GoogleEngine()
+    if kind == 'fake':
+        return FakeEngine(option) if option else FakeEngine()
+    raise ValueError(f"Unknown voice engine: {spec}")
+
+
+def microphone_chunks(stop, chunk_seconds=CHUNK_SECONDS):
+    """Yield PCM chunks from the default microphone until ``stop`` is set."""
+    try:
+        microphone = sr.Microphone(sample_rate=SAMPLE_RATE)
+    except (AttributeError, OSError) as e:  # SpeechRecognition raises AttributeError when PyAudio is missing
+        raise VoiceError(f"No microphone available: {e}")
+    frames = int(chunk_seconds * SAMPLE_RATE)
+    with microphone as source:
+        while not stop.is_set():
+            data = source.stream.read(frames)
+            yield sr.AudioData(data, source.SAMPLE_RATE, source.SAMPLE_WIDTH).get_raw_data(SAMPLE_RATE, SAMPLE_WIDTH)
+
+
+def file_chunks(path, chunk_seconds=CHUNK_SECONDS):
+    """Yield PCM chunks from a WAV, AIFF or FLAC file."""
+    source = sr.AudioFile(path)
+    try:
+        source.__enter__()
+    except ValueError as e:  # Not a format SpeechRecognition can decode
+        raise VoiceError(f"{os.path.basename(path)}: {e}")
+    try:
+        frames = max(1, int(chunk_seconds * source.SAMPLE_RATE))
+        while True:
+            data = source.stream.read(frames)
+            if not data:
+                break
+            yield sr.AudioData(data, source.SAMPLE_RATE, source.SAMPLE_WIDTH).get_raw_data(SAMPLE_RATE, SAMPLE_WIDTH)
+    finally:
+        source.__exit__(None, None, None)
+
+
+class Dictation:
+    """Record on a capture thread and transcribe on the calling thread, so slow engines never drop audio."""
+
+    def __init__(self, engine, on_text, chunks=None):
+        self.engine = engine
+        self.on_text = on_text
+        self.stop_event = threading.Event()
+        self.chunks = chunks if chunks is not None else microphone_chunks(self.stop_event)
+        self.audio = queue.Queue()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _capture(self):
+        try:
+            for chunk in self.chunks:
+                self.audio.put(chunk)
+                if self.stop_event.is_set():
+                    break
+        except Exception as e:
+            self.audio.put(e)
+        finally:
+            self.audio.put(None)
+
+    def run(self, task=None):
+        """Transcribe until ``stop`` is called (or the chunks run out); returns the full text."""
+        session = self.engine.start()
+        pieces = []
+        capture = threading.Thread(target=self._capture, name='diarybot-capture', daemon=True)
+        capture.start()
+        try:
+            while True:
+                if task is not None and task.cancelled:
+                    self.stop()
+                chunk = self.audio.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                text = session.accept(chunk)
+                if text:
+                    pieces.append(text)
+                    self.on_text(text)
+            text = session.finish()
+            if text:
+                pieces.append(text)
+                self.on_text(text)
+        finally:
+            self.stop()
+        return ' '.join(pieces)
+
+
+def transcribe_file(engine, path):
+    """Transcribe a whole audio file."""
+    return Dictation(engine, lambda text: None, file_chunks(path)).run()
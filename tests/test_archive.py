@@ -0,0 +1,134 @@
+import math
+import os
+
+from diarybot import archive
+from diarybot.archive import Archive, Segment, archivable, write_segment
+from diarybot.storage import JsonDirStore
+
+
+def make_entry(entry_id, date, content='A quiet day.', **extra):
+    entry = {'id': entry_id, 'title': f"Entry {entry_id}", 'content': content, 'date': date,
+             'emotion': 'neutral', 'sentiment_score': 0.25}
+    entry.update(extra)
+    return entry
+
+
+def month_of_entries(month, days, **extra):
+    return [make_entry(f"{month.replace('-', '')}{day:02d}_090000", f"{month}-{day:02d}T09:00:00",
+                       f"Day {day}. " * 50, **extra) for day in days]
+
+
+def test_segment_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'BLOCK_BYTES', 1000)  # Several entries per block, several blocks
+    entries = month_of_entries('2023-05', range(1, 21), attachments=['a.wav'])
+    entries[0]['sentiment_score'] = None
+    entries[2]['emotion'] = None
+    entries[3]['mood_tags'] = {'weather': 'rain', 'energy': 3}
+    entries[4]['content'] = 'Ünïcödé ✓ and "quotes"\n'
+    path = str(tmp_path / '2023-05.seg')
+    write_segment(path, entries)
+
+    segment = Segment(path)
+    assert len(segment) == len(entries)
+    assert len(segment.offsets) > 3
+    assert math.isnan(segment.scores[0])  # How a missing score is stored
+    assert segment.entries() == entries
+    # Out-of-order reads inflate the right block
+    assert [segment.content(row) for row in (19, 0, 10, 5)] == [entries[row]['content'] for row in (19, 0, 10, 5)]
+    segment.map.close()
+
+
+def test_empty_segment(tmp_path):
+    path = str(tmp_path / 'empty.seg')
+    write_segment(path, [])
+    segment = Segment(path)
+    assert len(segment) == 0 and segment.entries() == []
+    segment.map.close()
+
+
+def test_archivable():
+    entry = make_entry('20230501_090000', '2023-05-01T09:00:00')
+    assert archivable(entry)
+    assert archivable(dict(entry, date='2023-05-01T09:00:00.123456'))
+    assert not archivable(dict(entry, date='2023-05-01T09:00:00+02:00'))
+    assert not archivable(dict(entry, date='2023-05-01 09:00'))
+    assert not archivable(dict(entry, sentiment_score='0.2'))
+    assert not archivable({key: value for key, value in entry.items() if key != 'emotion'})
+
+
+def test_archive_month_merge(tmp_path):
+    store = Archive(str(tmp_path))
+    first, second = month_of_entries('2023-05', [1, 3]), month_of_entries('2023-05', [2])
+    store.write('alice', '2023-05', first)
+    merged = sorted(store.month('alice', '2023-05') + second, key=lambda x: x['date'])
+    store.write('alice', '2023-05', merged)
+    assert store.month('alice', '2023-05') == merged
+    assert [summary['id'] for summary in store.open('alice').summaries] == [entry['id'] for entry in merged]
+    assert store.month('alice', '2023-06') == []
+    store.close()
+
+
+def listing(store, user):
+    return ([entry['id'] for entry in store.iter_entries(user)], store.list_summaries(user), store.count(user))
+
+
+def test_compact_keeps_listing_and_merges_months(tmp_path):
+    store = JsonDirStore(str(tmp_path / 'entries'))
+    entries = month_of_entries('2023-04', [1, 15]) + month_of_entries('2023-05', [2, 20])
+    entries.append(make_entry('20240101_090000', '2024-01-01T09:00:00'))
+    entries.append(make_entry('20230410_090000', '2023-04-10T09:00:00+02:00'))
+    store.save_many('alice', entries)
+    before = listing(store, 'alice')
+
+    assert store.compact('alice', '2023-05-10') == 3  # The zoned date stays a file
+    assert listing(store, 'alice') == before
+    store.save_many('alice', month_of_entries('2023-05', [5]))
+    assert store.compact('alice', '2024') == 2  # 2024-01-01 is not before the cutoff
+    assert [entry['id'] for entry in store.archive.month('alice', '2023-05')] == \
+        ['20230502_090000', '20230505_090000', '20230520_090000']
+    ids, summaries, total = listing(store, 'alice')
+    assert total == len(entries) + 1 == len(ids) == len(summaries)
+    assert ids == [summary['id'] for summary in summaries]
+    for entry in entries:
+        assert store.get('alice', entry['id']) == entry
+    store.close()
+
+    reopened = JsonDirStore(str(tmp_path / 'entries'))
+    assert listing(reopened, 'alice') == (ids, summaries, total)
+    reopened.close()
+
+
+def test_live_file_wins_over_archived_copy(tmp_path):
+    store = JsonDirStore(str(tmp_path / 'entries'))
+    entry = make_entry('20230501_090000', '2023-05-01T09:00:00')
+    store.save_many('alice', [entry, make_entry('20230502_090000', '2023-05-02T09:00:00')])
+    assert store.compact('alice', '2024') == 2
+
+    edited = dict(entry, title='Edited', content='Rewritten after archiving.')
+    store.save('alice', edited)
+    assert store.get('alice', entry['id']) == edited
+    assert store.count('alice') == 2
+    assert [summary['title'] for summary in store.list_summaries('alice')] == ['Edited', 'Entry 20230502_090000']
+    assert next(store.iter_entries('alice')) == edited
+    store.close()
+
+
+def test_compact_leaves_files_saved_while_it_ran(tmp_path, monkeypatch):
+    store = JsonDirStore(str(tmp_path / 'entries'))
+    entry = make_entry('20230501_090000', '2023-05-01T09:00:00')
+    store.save('alice', entry)
+    edited = dict(entry, content='Saved while the segment was being written.')
+    write = store.archive.write
+
+    def write_then_save(*args):
+        write(*args)
+        store.save('alice', edited)
+
+    monkeypatch.setattr(store.archive, 'write', write_then_save)
+    assert store.compact('alice', '2024') == 0
+    assert os.path.exists(store.path_for('alice', entry['id']))
+    assert store.get('alice', entry['id']) == edited
+    assert store.archive.month('alice', '2023-05') == [entry]
+    assert store.count('alice') == 1
+    store.close()
+
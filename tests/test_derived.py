@@ -0,0 +1,83 @@
+import pytest
+
+from diarybot.core import DiaryCore
+from diarybot.storage import JsonDirStore, SQLiteStore
+
+
+def make_entry(entry_id, content, emotion='neutral', score=0.0):
+    return {'id': entry_id, 'title': f"Entry {entry_id}", 'content': content, 'date': f"2024-03-{entry_id[6:8]}T09:00:00",
+            'emotion': emotion, 'sentiment_score': score, 'attachments': []}
+
+
+def open_store(tmp_path, kind):
+    return JsonDirStore(str(tmp_path / 'entries')) if kind == 'json' else SQLiteStore(str(tmp_path / 'diary.db'))
+
+
+def open_core(tmp_path, kind):
+    return DiaryCore(open_store(tmp_path, kind), str(tmp_path / 'users'), str(tmp_path / 'attachments'))
+
+
+def found(core, query):
+    return [result['id'] for result in core.search('alice', query)]
+
+
+@pytest.mark.parametrize('kind', ['json', 'sqlite'])
+def test_derived_data_follows_rewrites_from_another_process(tmp_path, kind):
+    core = open_core(tmp_path, kind)
+    core.save_entries('alice', [make_entry('20240301_090000', 'walked along the beach'),
+                                make_entry('20240302_090000', 'quiet evening at home')])
+    assert found(core, 'beach') == ['20240301_090000']
+    assert core.aggregates('alice').emotion_counts['neutral'] == 2
+
+    # Same ids and count, so only a real staleness check notices.
+    other = open_store(tmp_path, kind)
+    other.save_many('alice', [make_entry('20240301_090000', 'hiked up the mountain', 'positive', 0.8)])
+    other.close()
+
+    assert found(core, 'beach') == []
+    assert found(core, 'mountain') == ['20240301_090000']
+    aggregates = core.aggregates('alice')
+    assert aggregates.emotion_counts == {'positive': 1, 'negative': 0, 'neutral': 1}
+    assert aggregates.total == 2
+    core.close()
+
+
+@pytest.mark.parametrize('kind', ['json', 'sqlite'])
+def test_persisted_derived_data_is_checked_on_load(tmp_path, kind):
+    core = open_core(tmp_path, kind)
+    core.save_entries('alice', [make_entry('20240301_090000', 'walked along the beach')])
+    core.search('alice', 'beach')
+    core.close()
+
+    store = open_store(tmp_path, kind)
+    store.save_many('alice', [make_entry('20240301_090000', 'a rainy afternoon', 'negative', -0.5)])
+    store.close()
+
+    core = open_core(tmp_path, kind)
+    assert found(core, 'rainy') == ['20240301_090000']
+    assert core.aggregates('alice').emotion_counts['negative'] == 1
+    core.close()
+
+
+def test_unchanged_store_skips_the_comparison(tmp_path, monkeypatch):
+    core = open_core(tmp_path, 'json')
+    core.save_entries('alice', [make_entry('20240301_090000', 'walked along the beach')])
+    core.search('alice', 'beach')
+    aggregates = core.aggregates('alice')
+    core.flush()
+    core.aggregates('alice')  # Creating the derived-data directories moved the store's revision once
+    assert aggregates.revision == core.store.revision('alice')
+
+    def no_listing(*args, **kwargs):
+        raise AssertionError("summaries listed although the store did not change")
+
+    monkeypatch.setattr(core.store, 'list_summaries', no_listing)
+    monkeypatch.setattr(core.store, 'versions', no_listing)
+    core.aggregates('alice')
+    assert found(core, 'beach') == ['20240301_090000']
+    monkeypatch.undo()
+
+    core.save_entries('alice', [make_entry('20240302_090000', 'quiet evening at home')])
+    assert core.aggregates('alice').total == 2
+    assert found(core, 'home') == ['20240302_090000']
+    core.close()
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from diarybot.export import export_pdf
+from diarybot.storage import JsonDirStore
+
+
+class RecordingTask:
+    def __init__(self):
+        self.reports = []
+
+    def check(self):
+        pass
+
+    def report(self, done, total=None, message=''):
+        self.reports.append((done, total))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JsonDirStore(str(tmp_path / 'entries'))
+    store.save_many('alice', [{'id': f"2024{month:02d}{day:02d}_090000", 'title': f"Day {day}", 'content': "Some words. " * 20,
+                               'date': f"2024-{month:02d}-{day:02d}T09:00:00", 'emotion': ('positive', 'negative')[day % 2],
+                               'sentiment_score': 0.5 - day % 2, 'attachments': []}
+                              for month in (1, 2) for day in range(1, 29)])
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('volume_size', [None, 100, 8])
+def test_progress_total_counts_only_matching_entries(store, tmp_path, volume_size):
+    task = RecordingTask()
+    filename = str(tmp_path / 'out.pdf')
+    files = export_pdf(store, 'alice', filename, start='2024-02-01', emotions=['positive'], volume_size=volume_size,
+                       workers=2, task=task)
+    assert all(os.path.exists(path) for path in files)
+    assert {total for _, total in task.reports} == {14}
+    assert task.reports[-1][0] == 14
+
+
+def test_unfiltered_total_is_the_entry_count(store, tmp_path):
+    task = RecordingTask()
+    export_pdf(store, 'alice', str(tmp_path / 'out.pdf'), task=task)
+    assert task.reports[-1] == (56, 56)
@@ -0,0 +1,149 @@
+import json
+import os
+
+import pytest
+
+from diarybot.journal import Journal
+from diarybot.storage import JsonDirStore
+
+
+def make_entry(entry_id, content='A quiet day.'):
+    return {'id': entry_id, 'title': f"Entry {entry_id}", 'content': content, 'date': '2024-03-01T09:00:00',
+            'emotion': 'neutral', 'sentiment_score': 0.0, 'attachments': []}
+
+
+def crash_after_journalling(root, user, entries):
+    """Journal a batch the way ``save_many`` does, then stop before its files are written."""
+    journal = Journal(os.path.join(root, '.journal', 'entries.log'))
+    journal.append(user, entries)
+    os.close(journal.fd)
+
+
+def test_recover_restores_missing_file_despite_torn_last_line(tmp_path):
+    root = str(tmp_path / 'entries')
+    JsonDirStore(root).close()
+    entry = make_entry('20240301_090000')
+    crash_after_journalling(root, 'alice', [entry])
+    with open(os.path.join(root, '.journal', 'entries.log'), 'ab') as f:
+        f.write(b'0badc0de {"user": "alice", "entr')  # A batch cut off mid-write
+
+    store = JsonDirStore(root)
+    assert store.get('alice', entry['id']) == entry
+    assert store.count('alice') == 1
+    assert os.path.getsize(store.journal.path) == 0
+    store.close()
+
+
+def test_recover_rewrites_truncated_entry_file(tmp_path):
+    root = str(tmp_path / 'entries')
+    store = JsonDirStore(root)
+    old = make_entry('20240301_090000', 'First draft.')
+    store.save('alice', old)
+    store.close()
+    new = make_entry('20240301_090000', 'Second draft, much longer than the first one.')
+    crash_after_journalling(root, 'alice', [new])
+    path = os.path.join(root, 'alice_20240301_090000.json')
+    with open(path, 'r+') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    store = JsonDirStore(root)
+    with open(path) as f:
+        assert json.load(f) == new
+    assert store.list_summaries('alice')[0]['id'] == new['id']
+    store.close()
+
+
+def test_recover_ignores_batches_already_applied(tmp_path):
+    root = str(tmp_path / 'entries')
+    store = JsonDirStore(root)
+    entry = make_entry('20240301_090000')
+    store.save('alice', entry)
+    store.journal.close()
+    mtime = os.stat(store.path_for('alice', entry['id'])).st_mtime_ns
+
+    store = JsonDirStore(root)
+    assert store.recover() == 0
+    assert os.stat(store.path_for('alice', entry['id'])).st_mtime_ns == mtime
+    store.close()
+
+
+def test_failed_fsync_does_not_block_checkpoints(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path / 'entries.log'))
+
+    def failing_fsync(fd):
+        raise OSError('disk gone')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'fsync', failing_fsync)
+        with pytest.raises(OSError):
+            journal.append('alice', [make_entry('20240301_090000')])
+    assert journal.in_flight == 0
+    assert journal.checkpoint() is True
+    journal.close()
+
+
+def test_checkpoint_keeps_journal_when_an_entry_file_cannot_be_flushed(tmp_path, monkeypatch):
+    root = str(tmp_path / 'entries')
+    store = JsonDirStore(root)
+    entry = make_entry('20240301_090000')
+    store.save('alice', entry)
+    path = store.path_for('alice', entry['id'])
+    real_fsync, journal_fd = os.fsync, store.journal.fd
+
+    def fsync_only_journal(fd):
+        if fd != journal_fd:
+            raise OSError('cannot flush')
+        real_fsync(fd)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'fsync', fsync_only_journal)
+        assert store.journal.checkpoint() is False
+        store.close()  # Does not raise; the batch stays journalled
+    reopened = Journal(store.journal.path)
+    assert list(reopened.records()) == [('alice', [entry])]
+    os.close(reopened.fd)
+    assert store.journal.unsynced == {path}
+
+    store = JsonDirStore(root)
+    assert store.get('alice', entry['id']) == entry
+    assert os.path.getsize(store.journal.path) == 0
+    store.close()
+
+
+def test_directories_are_not_opened_on_windows(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path / 'entries.log'))
+    path = tmp_path / 'alice_20240301_090000.json'
+    path.write_text('{}')
+    opened = []
+    real_open = os.open
+
+    def tracking_open(name, flags, *args):
+        opened.append(str(name))
+        return real_open(name, flags, *args)
+
+    monkeypatch.setattr(os, 'name', 'nt')
+    monkeypatch.setattr(os, 'open', tracking_open)
+    assert journal.checkpoint([str(path)]) is True
+    assert opened == [str(path)]
+    monkeypatch.undo()
+    journal.close()
+
+
+def test_recover_leaves_other_saves_temporary_files(tmp_path):
+    root = str(tmp_path / 'entries')
+    JsonDirStore(root).close()
+    entry = make_entry('20240301_090000')
+    crash_after_journalling(root, 'alice', [entry])
+    leftover = os.path.join(root, 'alice_20240301_090000.json.111.tmp')
+    in_progress = os.path.join(root, 'bob_20240302_100000.json.222.tmp')
+    abandoned = os.path.join(root, 'bob_20230101_100000.json.333.tmp')
+    for path in (leftover, in_progress, abandoned):
+        with open(path, 'w') as f:
+            f.write('{"id": ')
+    os.utime(abandoned, (0, 0))
+
+    store = JsonDirStore(root)
+    assert store.get('alice', entry['id']) == entry
+    assert not os.path.exists(leftover) and not os.path.exists(abandoned)
+    assert os.path.exists(in_progress)
+    store.close()
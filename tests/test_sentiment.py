@@ -0,0 +1,36 @@
+import importlib.metadata
+
+from diarybot import sentiment
+from diarybot.sentiment import SentimentCache, analyzer_version, classify, content_key
+
+
+def test_analyzer_version_comes_from_package_metadata():
+    assert analyzer_version() == f"textblob-{importlib.metadata.version('textblob')}"
+
+
+def test_analyzer_version_without_metadata(monkeypatch):
+    def missing(name):
+        raise importlib.metadata.PackageNotFoundError(name)
+
+    analyzer_version.cache_clear()
+    monkeypatch.setattr(importlib.metadata, 'version', missing)
+    try:
+        assert analyzer_version() == "textblob-unknown"
+    finally:
+        analyzer_version.cache_clear()
+
+
+def test_cache_keys_depend_on_analyzer_version(tmp_path, monkeypatch):
+    key = content_key("A good day.")
+    assert key == content_key("A good day.") != content_key("A bad day.")
+    cache = SentimentCache(str(tmp_path / 'sentiment.db'))
+    cache.put_many([(key, 0.7)])
+    assert cache.get_many([key, 'missing']) == {key: 0.7}
+    cache.close()
+
+    monkeypatch.setattr(sentiment, 'analyzer_version', lambda: "textblob-next")
+    assert sentiment.content_key("A good day.") != key
+
+
+def test_classify_thresholds():
+    assert [classify(p) for p in (0.5, 0.1, 0.0, -0.1, -0.5)] == ['positive', 'neutral', 'neutral', 'neutral', 'negative']
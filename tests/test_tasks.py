@@ -0,0 +1,52 @@
+import threading
+
+from diarybot.tasks import TaskRunner
+
+
+class FakeRoot:
+    """Stands in for ``tk.Tk``: ``after`` callbacks run when the test calls ``run``."""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def run(self, runner):
+        for future in [task.future for task in runner.active]:
+            future.result()
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+
+def test_failing_callback_does_not_stop_delivery():
+    root = FakeRoot()
+    runner = TaskRunner(root, cpu_workers=0)
+    delivered = []
+
+    def fail(result):
+        raise RuntimeError("widget destroyed")
+
+    runner.submit(lambda task: 1, on_done=fail)
+    root.run(runner)
+    assert not runner.polling
+
+    runner.submit(lambda task: 2, on_done=delivered.append)
+    runner.submit(lambda task: 3, on_done=delivered.append)
+    root.run(runner)
+    assert sorted(delivered) == [2, 3]
+    runner.shutdown()
+
+
+def test_detach_all_drops_callbacks_except_persistent_tasks():
+    root = FakeRoot()
+    runner = TaskRunner(root, cpu_workers=0)
+    release = threading.Event()
+    delivered = []
+    runner.submit(lambda task: release.wait(5) and 'stale', on_done=delivered.append)
+    runner.submit(lambda task: release.wait(5) and 'saved', on_done=delivered.append, persistent=True)
+    runner.detach_all()
+    release.set()
+    root.run(runner)
+    assert delivered == ['saved']
+    runner.shutdown()